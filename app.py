@@ -2,9 +2,20 @@ import streamlit as st
 import pandas as pd 
 import os 
 import plotly.express as px 
-import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 from datetime import datetime, timedelta 
-import io 
+import ingesta
+import modelo
+import memo
+import exportar
+import usuarios
+from modelo import (
+    COL_FECHA_KEY, COL_TECNICO_KEY, COL_CIUDAD_KEY, COL_TIPO_ORDEN_KEY, COL_ESTADO_KEY,
+    COL_TECNOLOGIA_KEY, COL_TIPO_MANUAL_KEY, COL_TEMP_DATETIME,
+    COL_FILTRO_TECNICO, COL_FILTRO_CIUDAD, COL_FILTRO_ESTADO, COL_FILTRO_TIPO_ORDEN, COL_FILTRO_TECNOLOGIA,
+    COL_FILTRO_TIPO_MANUAL
+)
 
 # --- FUNCIÓN DE COMPACIDAD Y CONFIGURACIÓN --- 
 def set_page_config_and_style(): 
@@ -58,6 +69,15 @@ MASTER_EXCEL = "datos.xlsx"
 USUARIOS_EXCEL = "usuarios.xlsx" 
 UPLOAD_FOLDER = "ExcelUploads" 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+CARPETA_HISTORICO = os.path.join(UPLOAD_FOLDER, ".historico")
+# Procesos para parsear en paralelo los archivos que no están en caché (1 = en serie)
+INGESTA_WORKERS = int(os.getenv("INGESTA_WORKERS", os.cpu_count() or 1))
+# Gráficos por técnico/ubicación: categorías mostradas (el resto se agrupa en "Otros")
+TOP_N_CATEGORIAS = int(os.getenv("TOP_N_CATEGORIAS", 15))
+# Series de líneas con más puntos que esto se dibujan con WebGL (scattergl) y sin etiqueta por punto
+PUNTOS_WEBGL = 120
+# Parte fija de una figura de Rendimiento en memo.MEMO (layout: ejes, títulos, plantilla), además de las trazas
+BYTES_LAYOUT_FIGURA = 64 * 1024
 
 # 1. DEFINICIÓN FINAL DEL MAPEO 
 MAPEO_COLUMNAS = { 
@@ -68,20 +88,7 @@ COLUMNAS_SELECCIONADAS = list(MAPEO_COLUMNAS.values())
 ENCABEZADOS_ESPERADOS = list(MAPEO_COLUMNAS.keys())
 FINAL_RENAMING_MAP = {v: k for k, v in MAPEO_COLUMNAS.items()} 
 
-# CLAVES DE COLUMNA
-COL_FECHA_KEY = 'A' 
-COL_TECNICO_KEY = 'C' 
-COL_CIUDAD_KEY = 'B' 
-COL_TIPO_ORDEN_KEY = 'I'
-COL_ESTADO_KEY = 'H' 
-COL_CONTRATO_KEY = 'D'
-COL_CLIENTE_KEY = 'E'
-COL_TAREA_KEY = 'G'
-COL_TECNOLOGIA_KEY = 'F'
-COL_TIPO_MANUAL_KEY = 'J'
-
 COL_FECHA_DESCRIPTIVA = FINAL_RENAMING_MAP[COL_FECHA_KEY] 
-COL_TEMP_DATETIME = '_DATETIME_' + COL_FECHA_KEY 
 
 COL_TECNICO_DESCRIPTIVA = FINAL_RENAMING_MAP.get(COL_TECNICO_KEY, 'TÉCNICO') 
 COL_CIUDAD_DESCRIPTIVA = FINAL_RENAMING_MAP.get(COL_CIUDAD_KEY, 'UBICACIÓN') 
@@ -90,149 +97,19 @@ COL_ESTADO_DESCRIPTIVA = FINAL_RENAMING_MAP.get(COL_ESTADO_KEY, 'ESTADO TAREA')
 COL_TECNOLOGIA_DESCRIPTIVA = FINAL_RENAMING_MAP.get(COL_TECNOLOGIA_KEY, 'TECNOLOGÍA')
 COL_TIPO_MANUAL_DESCRIPTIVA = FINAL_RENAMING_MAP.get(COL_TIPO_MANUAL_KEY, 'TIPO TAREA MANUAL')
 
-# Columnas temporales para filtros
-COL_FILTRO_TECNICO = '_Filtro_Tecnico_' 
-COL_FILTRO_CIUDAD = '_Filtro_Ubicacion_'
-COL_FILTRO_ESTADO = '_Filtro_Estado_' 
-COL_FILTRO_TIPO_ORDEN = '_Filtro_TipoOrden_'
-COL_FILTRO_TECNOLOGIA = '_Filtro_Tecnologia_'
-COL_FILTRO_TIPO_MANUAL = '_Filtro_TipoManual_'
-
-# Columnas para Gráficos
-COL_TIPO_INST = '_ES_INSTALACION_' 
-COL_TIPO_VISITA = '_ES_VISITA_'
-COL_TIPO_MIGRACION = '_ES_MIGRACION_'
-COL_TIPO_MANUAL = '_ES_TAREA_MANUAL_'
-COL_TIPO_CAMBIO_DIR = '_ES_CAMBIO_DIRECCION_'
-COL_TIPO_MIGRATEC = '_ES_MIGRATEC_'
-
-
-# --- FUNCIONES DE LIMPIEZA --- 
-@st.cache_data 
-def clean_tecnico(tecnico): 
-    s = str(tecnico).strip()
-    if '|' in s: s = s.split('|', 1)[1].strip() 
-    suffix = ' (tecnico)'
-    if s.lower().endswith(suffix): s = s[:-len(suffix)]
-    return s.strip()
-
-@st.cache_data 
-def clean_ciudad(ciudad): 
-    if isinstance(ciudad, str) and ',' in ciudad: return ciudad.split(',', 1)[0].strip() 
-    return str(ciudad).strip()
-
 # --- FUNCIONES DE COMPARACIÓN Y GRÁFICOS (MODO ESTANDAR) --- 
-@st.cache_data 
-def prepare_comparison_data(df): 
-    # Agrupación por CIUDAD y TÉCNICO
-    if df.empty: return pd.DataFrame()
-    df_temp = df.copy()
-    
-    # Flags de tipos
-    if COL_TIPO_ORDEN_KEY in df_temp.columns: 
-        tipo_orden = df_temp[COL_TIPO_ORDEN_KEY].astype(str)
-        df_temp[COL_TIPO_INST] = tipo_orden.str.contains('INSTALACION', case=False, na=False).astype(int) 
-        df_temp[COL_TIPO_VISITA] = tipo_orden.str.contains('VISITA TECNICA', case=False, na=False).astype(int)
-        mask_mig_orden = tipo_orden.str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        mask_mig_manual = False
-        if COL_TIPO_MANUAL_KEY in df_temp.columns:
-            mask_mig_manual = df_temp[COL_TIPO_MANUAL_KEY].astype(str).str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        df_temp[COL_TIPO_MIGRACION] = (mask_mig_orden | mask_mig_manual).astype(int)
-        df_temp[COL_TIPO_MANUAL] = tipo_orden.str.contains('TAREA MANUAL', case=False, na=False).astype(int)
-        df_temp[COL_TIPO_CAMBIO_DIR] = tipo_orden.str.contains(r'CAMBIO DE DIRECCI[ÓO]N', case=False, na=False, regex=True).astype(int)
-        df_temp[COL_TIPO_MIGRATEC] = tipo_orden.str.contains('MIGRATEC', case=False, na=False).astype(int)
-    else: 
-        df_temp[COL_TIPO_INST] = 0; df_temp[COL_TIPO_VISITA] = 0; df_temp[COL_TIPO_MIGRACION] = 0
-        df_temp[COL_TIPO_MANUAL] = 0; df_temp[COL_TIPO_CAMBIO_DIR] = 0; df_temp[COL_TIPO_MIGRATEC] = 0
-
-    if COL_FILTRO_TECNICO not in df_temp.columns or COL_FILTRO_CIUDAD not in df_temp.columns: return pd.DataFrame()
-
-    df_grouped = df_temp.groupby([COL_FILTRO_CIUDAD, COL_FILTRO_TECNICO]).agg( 
-        Total_Instalaciones=(COL_TIPO_INST, 'sum'), 
-        Total_Visitas=(COL_TIPO_VISITA, 'sum'),
-        Total_Migracion=(COL_TIPO_MIGRACION, 'sum'),
-        Total_TareaManual=(COL_TIPO_MANUAL, 'sum'),
-        Total_CambioDireccion=(COL_TIPO_CAMBIO_DIR, 'sum'),
-        Total_MigraTec=(COL_TIPO_MIGRATEC, 'sum'),
-        Total_Tareas=(COL_TIPO_INST, 'count')
-    ).reset_index()
-
-    # Convertir a int
-    cols_int = ['Total_Instalaciones','Total_Visitas','Total_Migracion','Total_TareaManual','Total_CambioDireccion','Total_MigraTec','Total_Tareas']
-    for c in cols_int: df_grouped[c] = df_grouped[c].astype(int)
-
-    return df_grouped.sort_values(by=COL_FILTRO_TECNICO)
-
-@st.cache_data 
-def prepare_city_comparison_data(df): 
-    if df.empty: return pd.DataFrame()
-    df_temp = df.copy()
-    if COL_TIPO_ORDEN_KEY in df_temp.columns: 
-        tipo_orden = df_temp[COL_TIPO_ORDEN_KEY].astype(str)
-        df_temp[COL_TIPO_INST] = tipo_orden.str.contains('INSTALACION', case=False, na=False).astype(int) 
-        df_temp[COL_TIPO_VISITA] = tipo_orden.str.contains('VISITA TECNICA', case=False, na=False).astype(int)
-        mask_mig_orden = tipo_orden.str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        mask_mig_manual = False
-        if COL_TIPO_MANUAL_KEY in df_temp.columns:
-            mask_mig_manual = df_temp[COL_TIPO_MANUAL_KEY].astype(str).str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        df_temp[COL_TIPO_MIGRACION] = (mask_mig_orden | mask_mig_manual).astype(int)
-        df_temp[COL_TIPO_MANUAL] = tipo_orden.str.contains('TAREA MANUAL', case=False, na=False).astype(int)
-        df_temp[COL_TIPO_CAMBIO_DIR] = tipo_orden.str.contains(r'CAMBIO DE DIRECCI[ÓO]N', case=False, na=False, regex=True).astype(int)
-        df_temp[COL_TIPO_MIGRATEC] = tipo_orden.str.contains('MIGRATEC', case=False, na=False).astype(int)
-    else: 
-        df_temp[COL_TIPO_INST] = 0; df_temp[COL_TIPO_VISITA] = 0; df_temp[COL_TIPO_MIGRACION] = 0
-        df_temp[COL_TIPO_MANUAL] = 0; df_temp[COL_TIPO_CAMBIO_DIR] = 0; df_temp[COL_TIPO_MIGRATEC] = 0
-
-    if COL_FILTRO_CIUDAD not in df_temp.columns: return pd.DataFrame()
-
-    df_grouped = df_temp.groupby([COL_FILTRO_CIUDAD]).agg( 
-        Total_Instalaciones=(COL_TIPO_INST, 'sum'), 
-        Total_Visitas=(COL_TIPO_VISITA, 'sum'),
-        Total_Migracion=(COL_TIPO_MIGRACION, 'sum'),
-        Total_TareaManual=(COL_TIPO_MANUAL, 'sum'),
-        Total_CambioDireccion=(COL_TIPO_CAMBIO_DIR, 'sum'),
-        Total_MigraTec=(COL_TIPO_MIGRATEC, 'sum'),
-    ).reset_index()
-
-    cols_int = ['Total_Instalaciones','Total_Visitas','Total_Migracion','Total_TareaManual','Total_CambioDireccion','Total_MigraTec']
-    for c in cols_int: df_grouped[c] = df_grouped[c].astype(int)
-
+# Reciben un corte del cubo de conteos (modelo.CuboConteos.filtrar), no las filas: el coste depende
+# del número de combinaciones distintas (día, filtros, tipo) y no del número de órdenes.
+# Se memorizan en memo.MEMO por (versión del dataset, estado de filtros), no con @st.cache_data.
+def prepare_city_comparison_data(celdas): 
+    # Total_Tareas (tareas distintas) es el volumen con el que se eligen las categorías del top-N
+    df_grouped = modelo.agregar_cubo(celdas, [COL_FILTRO_CIUDAD], total_tareas=True)
+    if df_grouped.empty: return df_grouped
     return df_grouped.sort_values(by=COL_FILTRO_CIUDAD)
 
-@st.cache_data
-def prepare_technician_comparison_data(df):
-    if df.empty: return pd.DataFrame()
-    df_temp = df.copy()
-    if COL_TIPO_ORDEN_KEY in df_temp.columns: 
-        tipo_orden = df_temp[COL_TIPO_ORDEN_KEY].astype(str)
-        df_temp[COL_TIPO_INST] = tipo_orden.str.contains('INSTALACION', case=False, na=False).astype(int) 
-        df_temp[COL_TIPO_VISITA] = tipo_orden.str.contains('VISITA TECNICA', case=False, na=False).astype(int)
-        mask_mig_orden = tipo_orden.str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        mask_mig_manual = False
-        if COL_TIPO_MANUAL_KEY in df_temp.columns:
-            mask_mig_manual = df_temp[COL_TIPO_MANUAL_KEY].astype(str).str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        df_temp[COL_TIPO_MIGRACION] = (mask_mig_orden | mask_mig_manual).astype(int)
-        df_temp[COL_TIPO_MANUAL] = tipo_orden.str.contains('TAREA MANUAL', case=False, na=False).astype(int)
-        df_temp[COL_TIPO_CAMBIO_DIR] = tipo_orden.str.contains(r'CAMBIO DE DIRECCI[ÓO]N', case=False, na=False, regex=True).astype(int)
-        df_temp[COL_TIPO_MIGRATEC] = tipo_orden.str.contains('MIGRATEC', case=False, na=False).astype(int)
-    else: 
-        df_temp[COL_TIPO_INST] = 0; df_temp[COL_TIPO_VISITA] = 0; df_temp[COL_TIPO_MIGRACION] = 0
-        df_temp[COL_TIPO_MANUAL] = 0; df_temp[COL_TIPO_CAMBIO_DIR] = 0; df_temp[COL_TIPO_MIGRATEC] = 0
-
-    if COL_FILTRO_TECNICO not in df_temp.columns: return pd.DataFrame()
-
-    df_grouped = df_temp.groupby([COL_FILTRO_TECNICO]).agg( 
-        Total_Instalaciones=(COL_TIPO_INST, 'sum'), 
-        Total_Visitas=(COL_TIPO_VISITA, 'sum'),
-        Total_Migracion=(COL_TIPO_MIGRACION, 'sum'),
-        Total_TareaManual=(COL_TIPO_MANUAL, 'sum'),
-        Total_CambioDireccion=(COL_TIPO_CAMBIO_DIR, 'sum'),
-        Total_MigraTec=(COL_TIPO_MIGRATEC, 'sum'),
-    ).reset_index()
-
-    cols_int = ['Total_Instalaciones','Total_Visitas','Total_Migracion','Total_TareaManual','Total_CambioDireccion','Total_MigraTec']
-    for c in cols_int: df_grouped[c] = df_grouped[c].astype(int)
-
+def prepare_technician_comparison_data(celdas):
+    df_grouped = modelo.agregar_cubo(celdas, [COL_FILTRO_TECNICO], total_tareas=True)
+    if df_grouped.empty: return df_grouped
     return df_grouped.sort_values(by=COL_FILTRO_TECNICO)
 
 # --- FUNCIÓN CORREGIDA (FIX PARA SESSION_STATE) ---
@@ -278,90 +155,282 @@ def st_multiselect_with_all_technicians(col, label, options, key):
     final_selection = st.session_state.get(key, [])
     return [s for s in final_selection if s not in (ALL_OPTION, SUP_OPTION)]
 
-@st.cache_data
-def prepare_date_comparison_data(df):
-    if df.empty or COL_TEMP_DATETIME not in df.columns: return pd.DataFrame()
-    df_temp = df.copy()
-    COL_FECHA_DIA_AGRUPACION = '_FECHA_DIA_'
-    df_temp[COL_FECHA_DIA_AGRUPACION] = df_temp[COL_TEMP_DATETIME].dt.date
-
-    if COL_TIPO_ORDEN_KEY in df_temp.columns: 
-        tipo_orden = df_temp[COL_TIPO_ORDEN_KEY].astype(str)
-        df_temp[COL_TIPO_INST] = tipo_orden.str.contains('INSTALACION', case=False, na=False).astype(int) 
-        df_temp[COL_TIPO_VISITA] = tipo_orden.str.contains('VISITA TECNICA', case=False, na=False).astype(int)
-        mask_mig_orden = tipo_orden.str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        mask_mig_manual = False
-        if COL_TIPO_MANUAL_KEY in df_temp.columns:
-             mask_mig_manual = df_temp[COL_TIPO_MANUAL_KEY].astype(str).str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-        df_temp[COL_TIPO_MIGRACION] = (mask_mig_orden | mask_mig_manual).astype(int)
-        df_temp[COL_TIPO_MANUAL] = tipo_orden.str.contains('TAREA MANUAL', case=False, na=False).astype(int)
-        df_temp[COL_TIPO_CAMBIO_DIR] = tipo_orden.str.contains(r'CAMBIO DE DIRECCI[ÓO]N', case=False, na=False, regex=True).astype(int)
-        df_temp[COL_TIPO_MIGRATEC] = tipo_orden.str.contains('MIGRATEC', case=False, na=False).astype(int)
-    else: 
-        df_temp[COL_TIPO_INST] = 0; df_temp[COL_TIPO_VISITA] = 0; df_temp[COL_TIPO_MIGRACION] = 0 
-        df_temp[COL_TIPO_MANUAL] = 0; df_temp[COL_TIPO_CAMBIO_DIR] = 0; df_temp[COL_TIPO_MIGRATEC] = 0
-
-    df_grouped = df_temp.groupby([COL_FECHA_DIA_AGRUPACION]).agg( 
-        Total_Instalaciones=(COL_TIPO_INST, 'sum'), 
-        Total_Visitas=(COL_TIPO_VISITA, 'sum'),
-        Total_Migracion=(COL_TIPO_MIGRACION, 'sum'),
-        Total_TareaManual=(COL_TIPO_MANUAL, 'sum'),
-        Total_CambioDireccion=(COL_TIPO_CAMBIO_DIR, 'sum'),
-        Total_MigraTec=(COL_TIPO_MIGRATEC, 'sum'),
-    ).reset_index()
-
-    cols_int = ['Total_Instalaciones','Total_Visitas','Total_Migracion','Total_TareaManual','Total_CambioDireccion','Total_MigraTec']
-    for c in cols_int: df_grouped[c] = df_grouped[c].astype(int)
-    return df_grouped.sort_values(by=COL_FECHA_DIA_AGRUPACION)
-
-def render_comparison_charts_vertical(df_comparacion, x_col, title_prefix, is_city_view=False):
-    chart_configs = [
-        {'col_name': 'Total_Instalaciones', 'title': 'Instalaciones', 'color': '#4CAF50'},
-        {'col_name': 'Total_Visitas', 'title': 'Visitas', 'color': '#FF9800'},
-        {'col_name': 'Total_Migracion', 'title': 'Migración', 'color': '#2196F3'},
-        {'col_name': 'Total_TareaManual', 'title': 'Tarea Manual', 'color': '#9C27B0'},
-        {'col_name': 'Total_CambioDireccion', 'title': 'Cambio de Dirección', 'color': '#F44336'},
-        {'col_name': 'Total_MigraTec', 'title': 'MigraTec', 'color': '#00BCD4'}
-    ]
-
-    st.markdown(f"#### Rendimiento {title_prefix} (Base Dinámica)")
-    bottom_margin = 60
+def prepare_date_comparison_data(celdas, granularidad='dia', fecha_desde=None):
+    # Por día, semana ISO o mes (columna _FECHA_DIA_ con objetos date: el día, o el inicio de la cubeta,
+    # que en la primera nunca es anterior a fecha_desde)
+    df_grouped = modelo.agregar_cubo(celdas, [modelo.COL_DIA], granularidad=granularidad, fecha_desde=fecha_desde)
+    if df_grouped.empty: return df_grouped
+    return df_grouped.sort_values(by=modelo.COL_FECHA_DIA)
+
+RENDIMIENTO_CHART_CONFIGS = [
+    {'col_name': 'Total_Instalaciones', 'title': 'Instalaciones', 'color': '#4CAF50'},
+    {'col_name': 'Total_Visitas', 'title': 'Visitas', 'color': '#FF9800'},
+    {'col_name': 'Total_Migracion', 'title': 'Migración', 'color': '#2196F3'},
+    {'col_name': 'Total_TareaManual', 'title': 'Tarea Manual', 'color': '#9C27B0'},
+    {'col_name': 'Total_CambioDireccion', 'title': 'Cambio de Dirección', 'color': '#F44336'},
+    {'col_name': 'Total_MigraTec', 'title': 'MigraTec', 'color': '#00BCD4'}
+]
+
+def build_comparison_figure(df_comparacion, x_col, is_city_view=False):
+    # Una sola figura (graph_objects, sin plotly express) con un subplot por tipo y el eje X compartido
     CHART_HEIGHT = 200 
-    xaxis_config = { 'tickangle': -45, 'tickfont': {'size': 9 if not is_city_view else 10} }
-    grid_config = { 'showgrid': True, 'gridcolor': '#cccccc', 'griddash': 'dot' }
-
-    for config in chart_configs:
-        with st.container(border=True):
-            st.markdown(f"##### {config['title']}")
-            fig = px.line(
-                df_comparacion, 
-                x=x_col, 
-                y=config['col_name'], 
-                markers=True, 
-                text=config['col_name'], 
-                height=CHART_HEIGHT,
-                color_discrete_sequence=[config['color']]
-            ) 
-            fig.update_traces(textposition='top center') 
-            fig.update_layout(
-                xaxis_title=None, 
-                yaxis_title='Total', 
-                margin=dict(t=20,b=bottom_margin,l=10,r=10), 
-                xaxis=xaxis_config 
-            )
-            fig.update_xaxes(**grid_config)
-            fig.update_yaxes(showgrid=False) 
-            st.plotly_chart(fig, use_container_width=True)
+    fig = make_subplots(rows=len(RENDIMIENTO_CHART_CONFIGS), cols=1, shared_xaxes=True, vertical_spacing=0.04,
+                        subplot_titles=[config['title'] for config in RENDIMIENTO_CHART_CONFIGS])
+    x = list(df_comparacion[x_col])
+    denso = len(x) > PUNTOS_WEBGL
+    for fila, config in enumerate(RENDIMIENTO_CHART_CONFIGS, start=1):
+        y = df_comparacion[config['col_name']].to_numpy()
+        if denso: traza = go.Scattergl(x=x, y=y, mode='lines+markers', name=config['title'], line={'color': config['color']}, marker={'color': config['color']}, showlegend=False)
+        else: traza = go.Scatter(
+            x=x, y=y, text=y, mode='lines+markers+text', textposition='top center', name=config['title'],
+            line={'color': config['color']}, marker={'color': config['color']}, showlegend=False
+        )
+        fig.add_trace(traza, row=fila, col=1)
+        fig.update_yaxes(title_text='Total', showgrid=False, row=fila, col=1)
+    fig.update_xaxes(tickangle=-45, tickfont={'size': 9 if not is_city_view else 10}, showgrid=True, gridcolor='#cccccc', griddash='dot')
+    fig.update_layout(height=CHART_HEIGHT * len(RENDIMIENTO_CHART_CONFIGS), margin=dict(t=40, b=60, l=10, r=10))
+    return fig
+
+def tamano_figura(df_comparacion, x_col):
+    # Cada traza guarda su copia de x y de y (y además como texto): se estima desde el agregado, sin recorrer la figura
+    por_traza = memo.tamano_aproximado(df_comparacion[x_col]) + 2 * max(memo.tamano_aproximado(df_comparacion[config['col_name']]) for config in RENDIMIENTO_CHART_CONFIGS)
+    return len(RENDIMIENTO_CHART_CONFIGS) * por_traza + BYTES_LAYOUT_FIGURA
+
+def render_comparison_charts_vertical(df_comparacion, x_col, title_prefix, is_city_view=False, clave_agregado=None):
+    # La figura se cachea en memo.MEMO con la clave del agregado: si no cambió, no se reconstruye
+    st.markdown(f"#### Rendimiento {title_prefix} (Base Dinámica)")
+    construir = lambda: build_comparison_figure(df_comparacion, x_col, is_city_view)
+    if clave_agregado is not None: fig = memo.MEMO.obtener(('figura', *clave_agregado), construir, tamano_figura(df_comparacion, x_col))
+    else: fig = construir()
+    st.plotly_chart(fig, use_container_width=True)
+
+# --- SECCIONES DEL DASHBOARD (RERUNS POR FRAGMENTO) ---
+# Grafo de dependencias entre secciones:
+#   snapshot de datos ─► filtros ─┬─► KPIs
+#                                 ├─► tabla ◄── widgets de la tabla (columnas, búsqueda, orden, página, export)
+#                                 ├─► gráficos de distribución (tecnología, ubicación)
+#                                 └─► rendimiento ◄── granularidad (Día / Semana / Mes)
+# Los filtros alimentan a todas las secciones, así que sus widgets re-ejecutan el script completo. Los widgets
+# de la tabla solo alimentan a la tabla: la sección es un st.fragment y paginar, ordenar, buscar, elegir
+# columnas o exportar re-ejecuta solo esa sección (sin recalcular filtros, KPIs ni redibujar gráficos).
+# Igual con el rendimiento: cambiar la granularidad re-ejecuta solo su fragmento sobre las celdas ya filtradas.
+# Entre reruns del fragmento se reutilizan los argumentos de la última ejecución completa.
+@st.fragment
+def render_tabla_datos(base_indexada, posiciones, clave_filtros):
+    st.markdown(f"#### 📑 Datos ({len(posiciones)})")
+    # Tabla paginada en el servidor: orden (permutaciones precalculadas de la base), búsqueda y
+    # página se resuelven sobre posiciones de fila; solo se materializa y envía la página visible.
+    # Columna descriptiva -> columna de la base (TÉCNICO se muestra ya limpio)
+    columnas_tabla = {
+        FINAL_RENAMING_MAP[k]: COL_FILTRO_TECNICO if k == COL_TECNICO_KEY and COL_FILTRO_TECNICO in base_indexada.datos.columns else k
+        for k in FINAL_RENAMING_MAP if k in base_indexada.datos.columns
+    }
+
+    all_cols = list(columnas_tabla)
+    default_cols_raw = [FINAL_RENAMING_MAP['A'], FINAL_RENAMING_MAP['B'], FINAL_RENAMING_MAP['C'], FINAL_RENAMING_MAP['G']]
+    default_cols = [c for c in default_cols_raw if c in all_cols]
+
+    cols_to_show = st.multiselect("**Columnas**:", options=all_cols, default=default_cols, key='raw_table_col_select')
+    columnas_visibles = cols_to_show if cols_to_show else all_cols
+
+    texto_busqueda = st.text_input("Buscar", key='tabla_buscar', placeholder="🔎 Buscar en columnas visibles", label_visibility="collapsed").strip()
+    col_orden, col_sentido = st.columns([3, 2])
+    with col_orden:
+        columna_orden = st.selectbox("Ordenar por", all_cols, index=all_cols.index(COL_FECHA_DESCRIPTIVA) if COL_FECHA_DESCRIPTIVA in all_cols else 0, key='tabla_orden')
+    with col_sentido:
+        ascendente = st.selectbox("Sentido", ["Asc.", "Desc."], key='tabla_sentido') == "Asc."
+    clave_orden = COL_TEMP_DATETIME if columna_orden == COL_FECHA_DESCRIPTIVA else columnas_tabla[columna_orden]
+
+    def ordenar_filas_tabla():
+        seleccion = posiciones
+        if texto_busqueda:
+            seleccion = seleccion[modelo.buscar_texto(base_indexada.datos, seleccion, [columnas_tabla[c] for c in columnas_visibles], texto_busqueda)]
+        return base_indexada.ordenar_seleccion(seleccion, clave_orden, ascendente)
+    clave_tabla = ('tabla', *clave_filtros, clave_orden, ascendente, texto_busqueda, tuple(columnas_visibles) if texto_busqueda else ())
+    orden_tabla = memo.MEMO.obtener(clave_tabla, ordenar_filas_tabla)
+
+    col_tamano, col_pagina = st.columns(2)
+    with col_tamano:
+        tamano_pagina = st.selectbox("Filas por página", [50, 100, 250, 500], key='tabla_tamano')
+    total_paginas = max(1, -(-len(orden_tabla) // tamano_pagina))
+    # Se ajusta la página guardada al nuevo total antes de crear el widget (filtros/búsqueda cambian el total)
+    st.session_state['tabla_pagina'] = min(max(int(st.session_state.get('tabla_pagina', 1)), 1), total_paginas)
+    with col_pagina:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key='tabla_pagina')
+
+    filas_pagina = orden_tabla[(pagina - 1) * tamano_pagina:pagina * tamano_pagina]
+    df_to_display = base_indexada.datos.iloc[filas_pagina][[columnas_tabla[c] for c in columnas_visibles]].set_axis(columnas_visibles, axis=1)
+
+    st.markdown('<div style="overflow-x: auto;">', unsafe_allow_html=True) 
+    st.data_editor(df_to_display, use_container_width=True, hide_index=True, key='editable_raw', num_rows="fixed") 
+    st.caption(f"Página {pagina} de {total_paginas} · {len(orden_tabla):,} filas")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Export bajo demanda: el archivo se genera solo al pulsar "Preparar" y se guarda en la sesión
+    # junto con la clave de filtros; si los filtros cambian, hay que volver a prepararlo.
+    col_formato, col_preparar = st.columns([3, 2])
+    with col_formato:
+        formato_export = st.selectbox("Formato", list(exportar.FORMATOS_EXPORTACION), key='export_formato', label_visibility="collapsed")
+    clave_export = (clave_filtros, formato_export)
+    with col_preparar:
+        if st.button("⚙️ Preparar", use_container_width=True, key='export_preparar'):
+            columnas_export = modelo.columnas_exportables(base_indexada.datos)
+            datos_export = base_indexada.datos.iloc[posiciones, base_indexada.datos.columns.get_indexer(columnas_export)]
+            st.session_state['export_archivo'] = (clave_export, exportar.exportar(datos_export.rename(columns=FINAL_RENAMING_MAP), formato_export))
+    export_archivo = st.session_state.get('export_archivo')
+    if export_archivo is not None and export_archivo[0] == clave_export:
+        contenido, extension, mime = export_archivo[1]
+        st.download_button(label="⬇️ Excel Filtrado" if extension == 'xlsx' else f"⬇️ {formato_export} Filtrado", data=contenido, file_name=f'data.{extension}', mime=mime, use_container_width=True)
+
+@st.fragment
+def render_rendimiento(celdas_metricas, clave_filtros, filtro_tecnico, estado_base, date_from, date_to):
+    st.markdown(f"### 📈 Rendimiento Detallado (Base: {estado_base.title()})")
+    with st.container(border=True): 
+        if len(filtro_tecnico) == 1:
+            # Granularidad automática (≤ ~60 puntos por serie según el rango elegido) o forzada por el usuario
+            opciones_granularidad = ['Automático', *modelo.GRANULARIDADES.values()]
+            eleccion_granularidad = st.selectbox("Agrupar por:", opciones_granularidad, key='rendimiento_granularidad')
+            if eleccion_granularidad == 'Automático': granularidad = modelo.elegir_granularidad(date_from, date_to)
+            else: granularidad = next(k for k, v in modelo.GRANULARIDADES.items() if v == eleccion_granularidad)
+            # date_from en la clave: etiqueta la primera cubeta (el tramo de filas puede ser el mismo con otra fecha)
+            clave_rendimiento = ('rendimiento_dia', granularidad, date_from, *clave_filtros)
+            df_comparacion_view = memo.MEMO.obtener(clave_rendimiento, lambda: prepare_date_comparison_data(celdas_metricas, granularidad, date_from)) 
+            x_col, title, is_city_view = modelo.COL_FECHA_DIA, f"por {modelo.GRANULARIDADES[granularidad]}: **{filtro_tecnico[0]}**", False
+        elif len(filtro_tecnico) > 1:
+            clave_rendimiento = ('rendimiento_tecnico', *clave_filtros)
+            df_comparacion_view = memo.MEMO.obtener(clave_rendimiento, lambda: modelo.top_n_con_otros(
+                prepare_technician_comparison_data(celdas_metricas), COL_FILTRO_TECNICO, [*modelo.TOTALES_TIPO, 'Total_Tareas'], TOP_N_CATEGORIAS, 'Total_Tareas')) 
+            x_col, title, is_city_view = COL_FILTRO_TECNICO, "por Técnico", False 
+        else:
+            clave_rendimiento = ('rendimiento_ciudad', *clave_filtros)
+            df_comparacion_view = memo.MEMO.obtener(clave_rendimiento, lambda: modelo.top_n_con_otros(
+                prepare_city_comparison_data(celdas_metricas), COL_FILTRO_CIUDAD, [*modelo.TOTALES_TIPO, 'Total_Tareas'], TOP_N_CATEGORIAS, 'Total_Tareas')) 
+            x_col, title, is_city_view = COL_FILTRO_CIUDAD, "por Ubicación", True
+        
+        if not df_comparacion_view.empty: 
+            render_comparison_charts_vertical(df_comparacion_view, x_col, title, is_city_view, clave_rendimiento) 
+        else: st.info("No hay datos de rendimiento.")
+
+# Panel de estado del trabajador de ingesta. st.tabs ejecuta el cuerpo de todas las pestañas (no solo la
+# visible), así que un run_every fijo re-ejecutaría el panel de cada sesión de admin mientras siga conectada:
+# solo se sondea mientras el trabajador tiene archivos pendientes o en curso, y al terminar se relanza la app
+# completa para mostrar la versión nueva. En reposo el panel no se refresca solo (botón "Actualizar").
+def render_estado_ingesta(version_mostrada):
+    if modelo.TRABAJADOR.ocupado(): sondear_estado_ingesta(version_mostrada)
+    else: estado_ingesta_en_reposo(version_mostrada)
+
+def version_publicada():
+    publicado = modelo.SNAPSHOT.actual
+    return publicado.historico.version if publicado is not None and publicado.historico is not None else None
+
+@st.fragment(run_every=modelo.INGESTA_INTERVALO_S)
+def sondear_estado_ingesta(version_mostrada):
+    if not modelo.TRABAJADOR.ocupado(): st.rerun()
+    mostrar_estado_ingesta(version_mostrada)
+
+@st.fragment
+def estado_ingesta_en_reposo(version_mostrada):
+    if st.button("🔄 Actualizar", key='estado_ingesta_actualizar'):
+        if modelo.TRABAJADOR.ocupado() or version_publicada() != version_mostrada: st.rerun()
+    mostrar_estado_ingesta(version_mostrada)
+
+def mostrar_estado_ingesta(version_mostrada):
+    estado = modelo.TRABAJADOR.estado()
+    if estado['fase'] == 'procesando':
+        avance = estado['hechos'] / estado['total'] if estado['total'] else 0.0
+        st.progress(avance, text=f"🔄 Ingesta en curso: {estado['detalle'] or 'preparando'} ({estado['hechos']}/{estado['total']})")
+        if estado['cola']: st.caption("En cola: " + ", ".join(estado['cola']))
+    elif estado['pendiente']: st.caption("🔄 Cambios detectados: la ingesta empieza en unos segundos")
+    elif estado['fase'] == 'error': st.error(f"Error en la ingesta: {estado['error']}")
+    elif estado['publicado'] is not None:
+        st.caption(f"Última ingesta: {estado['publicado']:%H:%M:%S} ({estado['duracion']:.1f} s)")
+    if version_mostrada is not None:
+        retenidas = modelo.SNAPSHOT.versiones_retenidas()
+        st.caption(f"Versión de datos compartida: {version_mostrada}" + (f" · versiones anteriores aún en uso: {retenidas}" if retenidas else ""))
+
+# --- CARGA Y COMBINACIÓN DE DATOS ---
+def archivos_fuente():
+    return [os.path.join(UPLOAD_FOLDER, f) for f in ingesta.listar_archivos_datos(UPLOAD_FOLDER)]
+
+
+def firmar_fuentes(archivos_completos=None):
+    if archivos_completos is None: archivos_completos = archivos_fuente()
+    return (ingesta.firma_archivos(archivos_completos + [MASTER_EXCEL]), tuple(MAPEO_COLUMNAS.items()))
+
+
+def construir_base(archivos_completos, progreso=None):
+    # Devuelve (HistoricoMensual o None, filas de origen, avisos). Se ejecuta solo cuando cambia la firma
+    # de los archivos fuente (ver modelo.SNAPSHOT); los avisos se muestran en todas las sesiones.
+    # progreso(detalle, hechos, total) informa del avance al trabajador de ingesta (panel de administración).
+    avisar = progreso or (lambda detalle, hechos=0, total=0: None)
+    avisos = []
+    historico = None
+    particiones = []
+    filas_origen = 0
+
+    if archivos_completos: 
+        # Histórico mensual ya guardado para estas mismas fuentes (p.ej. tras reiniciar): no se lee ningún archivo
+        firma_historico = firmar_fuentes(archivos_completos)
+        historico = modelo.HistoricoMensual.abrir(CARPETA_HISTORICO, firma_historico)
+        if historico is not None: return historico, historico.filas_origen, historico.avisos
+        ingesta.podar_cache(archivos_completos)
+        try: 
+            total_columnas_mapeadas = 0 
+            # Caché por archivo (ruta, tamaño, mtime, hash): solo se parsean archivos nuevos o modificados,
+            # y esos se reparten en un pool de procesos. El orden de las particiones sigue el de archivos_completos.
+            lecturas = ingesta.cargar_archivos(archivos_completos, MAPEO_COLUMNAS, workers=INGESTA_WORKERS,
+                                               progreso=lambda ruta, hechos, total: avisar(f"Leyendo {os.path.basename(ruta)}", hechos, total))
+            for f, (df_temp, columnas_encontradas_en_archivo, error_lectura) in zip(archivos_completos, lecturas): 
+                if error_lectura is not None: avisos.append(('warning', f"Error leyendo {f}: {error_lectura}")); continue
+                if df_temp is not None: 
+                    particiones.append((f, df_temp)) 
+                    filas_origen += len(df_temp)
+                    total_columnas_mapeadas += columnas_encontradas_en_archivo
+            if not particiones or filas_origen == 0 or total_columnas_mapeadas == 0: 
+                avisos.append(('warning', "No se encontraron columnas mapeables."))
+            else:
+                # Dataset particionado por archivo: solo se limpian las particiones nuevas o modificadas y
+                # solo se reescriben los meses que tocan
+                avisar("Limpiando y guardando el histórico por mes")
+                modelo.DATASET.sincronizar(particiones)
+                historico = modelo.DATASET.guardar(CARPETA_HISTORICO, firma_historico, filas_origen, avisos)
+        except Exception as e: avisos.append(('error', f"Error al combinar: {e}")); historico = None
+
+    if historico is None: 
+        try: 
+            datos = pd.read_excel(MASTER_EXCEL) 
+            columnas_existentes = [col for col in COLUMNAS_SELECCIONADAS if col in datos.columns] 
+            datos = datos[columnas_existentes] 
+        except: 
+            # 💥 DATOS DE PRUEBA 💥
+            data = { 
+                'ID_TAREA': [101, 102, 103, 104, 105, 106, 107, 108, 109, 110] * 10,
+                'TECNOLOGIA_COL': ['ADSL', 'ADSL', 'HFC', 'HFC', 'GPON', 'GPON', 'ADSL', 'HFC', 'GPON', 'ADSL'] * 10,
+                'ESTADO': ['SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA'] * 10,
+                'TIPO_ORDEN': ['INSTALACION', 'VISITA TECNICA', 'MIGRACIÓN', 'TAREA MANUAL', 'CAMBIO DE DIRECCIÓN', 'MIGRATEC', 'INSTALACION', 'VISITA TECNICA', 'MIGRACIÓN', 'TAREA MANUAL'] * 10,
+                'UBICACION': ['Bogotá, 123', 'Bogotá, 456', 'Cali, 123', 'Cali, 456', 'Bogotá, 789', 'Medellín, 123', 'Medellín, 456', 'Medellín, 789', 'Cali, 789', 'Bogotá, 123'] * 10,
+                'TECNICO': ['T|Juan Pérez (tecnico)', 'T|Juan Pérez (tecnico)', 'T|Pedro López (tecnico)', 'T|Pedro López', 'T|Ana Gómez (tecnico)', 'T|Ana Gómez', 'T|Juan Pérez (tecnico)', 'T|Juan Pérez', 'T|Pedro López (tecnico)', 'T|Ana Gómez (tecnico)'] * 10,
+                'CONTRATO': ['C1']*100,
+                'CLIENTE': ['Cliente A']*100,
+                'FECHA': pd.to_datetime([f'2025-10-{d:02d}' for d in range(1, 11)] * 10),
+                'TIPO_TAREA_MANUAL': ['N/A', 'N/A', 'N/A', 'Auditoría', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', 'Retorno'] * 10
+            } 
+            datos = pd.DataFrame(data) 
+            RENAME_DUMMY = {
+                'FECHA': 'A', 'UBICACION': 'B', 'TECNICO': 'C', 'CONTRATO': 'D', 'CLIENTE': 'E', 
+                'TECNOLOGIA_COL': 'F', 'ID_TAREA': 'G', 'ESTADO': 'H', 'TIPO_ORDEN': 'I', 'TIPO_TAREA_MANUAL': 'J'
+            }
+            datos = datos.rename(columns=RENAME_DUMMY)
+            datos.columns = COLUMNAS_SELECCIONADAS 
+        filas_origen = len(datos)
+        historico = modelo.HistoricoMensual.en_memoria(modelo.limpiar_datos(datos), filas_origen)
+    return historico, filas_origen, avisos
 
 # --- LECTURA DE USUARIOS ---
-try: 
-    usuarios_df = pd.read_excel(USUARIOS_EXCEL) 
-    usuarios_df['Usuario'] = usuarios_df['Usuario'].astype(str).str.strip() 
-    usuarios_df['Contraseña'] = usuarios_df['Contraseña'].astype(str).str.strip() 
-    usuarios_df['Rol'] = usuarios_df['Rol'].astype(str).str.strip() 
-except FileNotFoundError: 
+# Solo se consulta al iniciar sesión; el directorio se cachea por proceso hasta que cambie el archivo
+def usuarios_por_defecto():
     usuarios_data = { 'Usuario': ['admin', 'user'], 'Contraseña': ['12345', 'password'], 'Rol': ['admin', 'analyst'] } 
-    usuarios_df = pd.DataFrame(usuarios_data) 
+    return pd.DataFrame(usuarios_data) 
 
 # --- SESSION STATE --- 
 if 'login' not in st.session_state: st.session_state.login = False 
@@ -384,13 +453,10 @@ if not st.session_state.login:
         usuario_input = st.text_input("Usuario") 
         contrasena_input = st.text_input("Contraseña", type="password")
         if st.button("Iniciar sesión", use_container_width=True): 
-            user_row = usuarios_df[
-                (usuarios_df["Usuario"].str.lower() == usuario_input.strip().lower()) & 
-                (usuarios_df["Contraseña"] == contrasena_input.strip()) 
-            ] 
-            if not user_row.empty: 
+            rol_usuario = usuarios.autenticar(USUARIOS_EXCEL, usuario_input, contrasena_input, usuarios_por_defecto)
+            if rol_usuario is not None: 
                 st.session_state.login = True 
-                st.session_state.rol = user_row.iloc[0]["Rol"] 
+                st.session_state.rol = rol_usuario 
                 st.session_state.usuario = usuario_input.strip() 
                 st.rerun() 
             else: st.error("Usuario o contraseña incorrectos")
@@ -408,76 +474,26 @@ else:
         st.button("Cerrar sesión", on_click=lambda: st.session_state.update({"login": False, "rol": None, "usuario": None}), key="logout_btn", use_container_width=True)
 
     # --- CARGA Y COMBINACIÓN DE DATOS --- 
-    archivos_para_combinar_nombres = [f for f in os.listdir(UPLOAD_FOLDER) if f.lower().endswith(('.xlsx', '.xls', '.csv'))] 
+    archivos_para_combinar_nombres = ingesta.listar_archivos_datos(UPLOAD_FOLDER) 
     num_archivos_cargados = len(archivos_para_combinar_nombres) 
-    datos = None 
-    df_list = []
+    archivos_completos = [os.path.join(UPLOAD_FOLDER, f) for f in archivos_para_combinar_nombres]
 
     if archivos_para_combinar_nombres: 
         st.info(f"💾 **{num_archivos_cargados}** archivo(s) cargado(s) y combinado(s).") 
-        archivos_completos = [os.path.join(UPLOAD_FOLDER, f) for f in archivos_para_combinar_nombres]
-        try: 
-            total_columnas_mapeadas = 0 
-            for f in archivos_completos: 
-                try: df = pd.read_csv(f, encoding='latin1') if f.lower().endswith('.csv') else pd.read_excel(f) 
-                except UnicodeDecodeError: 
-                    try: df = pd.read_csv(f, encoding='utf-8') 
-                    except Exception as csv_err: st.warning(f"Error leyendo {f}: {csv_err}"); continue 
-                except Exception as e: st.warning(f"Error leyendo {f}: {e}"); continue
-
-                cleaned_names = [] 
-                name_counts = {} 
-                for name in df.columns: 
-                    cleaned_name = str(name).upper().strip() 
-                    name_counts[cleaned_name] = name_counts.get(cleaned_name, 0) + 1 
-                    if name_counts[cleaned_name] > 1: cleaned_name = f"{cleaned_name}_{name_counts[cleaned_name]}" 
-                    cleaned_names.append(cleaned_name) 
-                df.columns = cleaned_names
-
-                df_temp = pd.DataFrame() 
-                columnas_encontradas_en_archivo = 0 
-                for encabezado_excel, columna_final in MAPEO_COLUMNAS.items(): 
-                    if encabezado_excel in df.columns: 
-                        columna_data = df[encabezado_excel]
-                        if isinstance(columna_data, pd.DataFrame): columna_data = columna_data.iloc[:, 0]
-                        if encabezado_excel in df.columns: 
-                            df_temp[columna_final] = columna_data 
-                            columnas_encontradas_en_archivo += 1
-                if not df_temp.empty: 
-                    df_temp = df_temp.reindex(columns=COLUMNAS_SELECCIONADAS, fill_value=None) 
-                    df_list.append(df_temp) 
-                    total_columnas_mapeadas += columnas_encontradas_en_archivo
-            if df_list: datos = pd.concat(df_list, ignore_index=True)
-            if datos is None or datos.empty or total_columnas_mapeadas == 0: 
-                st.warning("No se encontraron columnas mapeables."); datos = None
-        except Exception as e: st.error(f"Error al combinar: {e}"); datos = None
-
-    if datos is None: 
-        try: 
-            datos = pd.read_excel(MASTER_EXCEL) 
-            columnas_existentes = [col for col in COLUMNAS_SELECCIONADAS if col in datos.columns] 
-            datos = datos[columnas_existentes] 
-        except: 
-            # 💥 DATOS DE PRUEBA 💥
-            data = { 
-                'ID_TAREA': [101, 102, 103, 104, 105, 106, 107, 108, 109, 110] * 10,
-                'TECNOLOGIA_COL': ['ADSL', 'ADSL', 'HFC', 'HFC', 'GPON', 'GPON', 'ADSL', 'HFC', 'GPON', 'ADSL'] * 10,
-                'ESTADO': ['SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA', 'Pendiente', 'INSATISFACTORIA', 'SATISFACTORIA'] * 10,
-                'TIPO_ORDEN': ['INSTALACION', 'VISITA TECNICA', 'MIGRACIÓN', 'TAREA MANUAL', 'CAMBIO DE DIRECCIÓN', 'MIGRATEC', 'INSTALACION', 'VISITA TECNICA', 'MIGRACIÓN', 'TAREA MANUAL'] * 10,
-                'UBICACION': ['Bogotá, 123', 'Bogotá, 456', 'Cali, 123', 'Cali, 456', 'Bogotá, 789', 'Medellín, 123', 'Medellín, 456', 'Medellín, 789', 'Cali, 789', 'Bogotá, 123'] * 10,
-                'TECNICO': ['T|Juan Pérez (tecnico)', 'T|Juan Pérez (tecnico)', 'T|Pedro López (tecnico)', 'T|Pedro López', 'T|Ana Gómez (tecnico)', 'T|Ana Gómez', 'T|Juan Pérez (tecnico)', 'T|Juan Pérez', 'T|Pedro López (tecnico)', 'T|Ana Gómez (tecnico)'] * 10,
-                'CONTRATO': ['C1']*100,
-                'CLIENTE': ['Cliente A']*100,
-                'FECHA': pd.to_datetime([f'2025-10-{d:02d}' for d in range(1, 11)] * 10),
-                'TIPO_TAREA_MANUAL': ['N/A', 'N/A', 'N/A', 'Auditoría', 'N/A', 'N/A', 'N/A', 'N/A', 'N/A', 'Retorno'] * 10
-            } 
-            datos = pd.DataFrame(data) 
-            RENAME_DUMMY = {
-                'FECHA': 'A', 'UBICACION': 'B', 'TECNICO': 'C', 'CONTRATO': 'D', 'CLIENTE': 'E', 
-                'TECNOLOGIA_COL': 'F', 'ID_TAREA': 'G', 'ESTADO': 'H', 'TIPO_ORDEN': 'I', 'TIPO_TAREA_MANUAL': 'J'
-            }
-            datos = datos.rename(columns=RENAME_DUMMY)
-            datos.columns = COLUMNAS_SELECCIONADAS 
+    # Snapshot compartido por todas las sesiones. Solo la primera carga se hace en la petición; después,
+    # los cambios en los archivos fuente los procesa el trabajador de ingesta en segundo plano y, mientras
+    # tanto, se sigue sirviendo el snapshot anterior.
+    firma_fuentes = firmar_fuentes(archivos_completos)
+    snapshot = modelo.SNAPSHOT.obtener(firma_fuentes, lambda: construir_base(archivos_completos), esperar_cambios=not modelo.TRABAJADOR.activo)
+    modelo.TRABAJADOR.iniciar(firmar_fuentes, lambda progreso: construir_base(archivos_fuente(), progreso))
+    if snapshot.firma != firma_fuentes:
+        modelo.TRABAJADOR.avisar()
+        st.info("🔄 Procesando cambios en los archivos en segundo plano; se muestran los datos anteriores hasta que terminen.")
+    for nivel, mensaje in snapshot.avisos:
+        if nivel == 'error': st.error(mensaje)
+        else: st.warning(mensaje)
+    historico = snapshot.historico
+    filas_origen = snapshot.filas_origen
     if not archivos_para_combinar_nombres: st.warning("Usando **Datos de Prueba**.")
 
     # --- TABS --- 
@@ -489,6 +505,7 @@ else:
         with tab_admin: 
             st.header("⚙️ Administración de Archivos Fuente") 
             st.metric(label="Documentos Cargados", value=f"{num_archivos_cargados} archivos") 
+            render_estado_ingesta(historico.version if historico is not None else None)
             st.markdown("---")
             col_upload, col_delete = st.columns(2)
             with col_upload: 
@@ -497,20 +514,29 @@ else:
                 if st.button("📤 Guardar archivos"): 
                     if nuevos_archivos: 
                         for f in nuevos_archivos: 
-                            with open(os.path.join(UPLOAD_FOLDER, f.name), "wb") as file: file.write(f.getbuffer()) 
+                            ruta = os.path.join(UPLOAD_FOLDER, f.name)
+                            # Se escribe con otro nombre y se renombra al final: el trabajador de ingesta
+                            # nunca ve un archivo a medio escribir
+                            with open(ruta + ".subiendo", "wb") as file: file.write(f.getbuffer()) 
+                            os.replace(ruta + ".subiendo", ruta)
                             st.success(f"Archivo '{f.name}' guardado.") 
+                        modelo.TRABAJADOR.avisar()
                     st.info("Recargando..."); st.rerun()
             with col_delete: 
                 st.subheader("Eliminar") 
-                archivos_actuales = os.listdir(UPLOAD_FOLDER)
+                archivos_actuales = ingesta.listar_archivos_datos(UPLOAD_FOLDER)
                 eliminar = st.multiselect("Selecciona a eliminar", archivos_actuales) 
                 if st.button("🗑️ Eliminar seleccionados"): 
                     if eliminar: 
-                        for f in eliminar: os.remove(os.path.join(UPLOAD_FOLDER, f)) 
+                        for f in eliminar: 
+                            ingesta.eliminar_archivo(os.path.join(UPLOAD_FOLDER, f))
+                        modelo.TRABAJADOR.avisar()
                         st.success("Eliminados. Recargando..."); st.rerun()
                 if archivos_actuales and st.button("🔴 Eliminar TODOS", type="primary"): 
-                    for f in archivos_actuales: os.remove(os.path.join(UPLOAD_FOLDER, f)) 
+                    for f in archivos_actuales: 
+                        ingesta.eliminar_archivo(os.path.join(UPLOAD_FOLDER, f))
                     if os.path.exists(MASTER_EXCEL): os.remove(MASTER_EXCEL) 
+                    modelo.TRABAJADOR.avisar()
                     st.success("Todos eliminados."); st.rerun()
             st.markdown("---")
 
@@ -518,47 +544,14 @@ else:
     # --- PESTAÑA DEL DASHBOARD --- 
     # ---------------------------------------------------------------------- 
     with tab_dashboard: 
-        if datos is None or datos.empty: 
+        if historico is None or filas_origen == 0: 
             st.warning("No hay datos para mostrar.") 
         else:
-            # 1. PREPARACIÓN INICIAL DE DATOS (LIMPIEZA GENERAL)
-            datos_base_limpia = datos.copy() 
-            datos_base_limpia[COL_TEMP_DATETIME] = pd.to_datetime(datos_base_limpia[COL_FECHA_KEY], errors='coerce') 
-            datos_base_limpia.dropna(subset=[COL_TEMP_DATETIME], inplace=True)
-            
-            # Pre-procesamiento de columnas filtro (Se hace UNA VEZ sobre la base)
-            if COL_TECNICO_KEY in datos_base_limpia.columns: 
-                datos_base_limpia[COL_FILTRO_TECNICO] = datos_base_limpia[COL_TECNICO_KEY].astype(str).apply(clean_tecnico) 
-            if COL_CIUDAD_KEY in datos_base_limpia.columns: 
-                datos_base_limpia[COL_FILTRO_CIUDAD] = datos_base_limpia[COL_CIUDAD_KEY].astype(str).apply(clean_ciudad)
-            if COL_ESTADO_KEY in datos_base_limpia.columns:
-                datos_base_limpia[COL_FILTRO_ESTADO] = datos_base_limpia[COL_ESTADO_KEY].astype(str).str.upper().str.strip()
-                datos_base_limpia[COL_FILTRO_ESTADO].fillna("SIN ESTADO", inplace=True) 
-            if COL_TIPO_ORDEN_KEY in datos_base_limpia.columns:
-                datos_base_limpia[COL_FILTRO_TIPO_ORDEN] = datos_base_limpia[COL_TIPO_ORDEN_KEY].astype(str).str.upper().str.strip()
-                datos_base_limpia[COL_FILTRO_TIPO_ORDEN].fillna("SIN TIPO", inplace=True) 
-            if COL_TECNOLOGIA_KEY in datos_base_limpia.columns:
-                datos_base_limpia[COL_FILTRO_TECNOLOGIA] = datos_base_limpia[COL_TECNOLOGIA_KEY].astype(str).str.upper().str.strip()
-                datos_base_limpia[COL_FILTRO_TECNOLOGIA].fillna("SIN TECNOLOGIA", inplace=True) 
-            if COL_TIPO_MANUAL_KEY in datos_base_limpia.columns:
-                datos_base_limpia[COL_FILTRO_TIPO_MANUAL] = datos_base_limpia[COL_TIPO_MANUAL_KEY].astype(str).str.upper().str.strip()
-                datos_base_limpia[COL_FILTRO_TIPO_MANUAL] = datos_base_limpia[COL_FILTRO_TIPO_MANUAL].replace(['NAN', 'NONE'], 'SIN TIPO MANUAL')
-
-            if datos_base_limpia.empty: 
+            # 1. PREPARACIÓN INICIAL DE DATOS: la limpieza (fecha válida + columnas _Filtro_*) ya se hizo
+            # por partición en modelo.limpiar_datos al cargar; las bases del histórico son compartidas, no modificar in-place.
+            if historico.filas == 0: 
                 st.warning("No hay registros con fechas válidas para mostrar.") 
             else:
-                @st.cache_data 
-                def get_multiselect_options(df, col_key_filtro): 
-                    if col_key_filtro not in df.columns: return [] 
-                    opciones = sorted([v for v in df[col_key_filtro].astype(str).unique() if pd.notna(v) and str(v).strip() not in ('nan', 'none', '')]) 
-                    return opciones
-
-                @st.cache_data 
-                def apply_filter(df, col_key_filtro, selected_options): 
-                    if not selected_options: return df
-                    if col_key_filtro not in df.columns: return df 
-                    return df[df[col_key_filtro].astype(str).isin(selected_options)]
-                    
                 # -----------------------------------------------------------------------------
                 # --- PANEL DE CONTROL: FILTROS (Lógica de Filtro Cruzado / Cross-Filtering) --- 
                 # -----------------------------------------------------------------------------
@@ -581,9 +574,11 @@ else:
                     )
 
                     with col_desde: 
-                        min_date_global = datos_base_limpia[COL_TEMP_DATETIME].min().replace(hour=0, minute=0, second=0, microsecond=0) 
-                        max_date_global = datos_base_limpia[COL_TEMP_DATETIME].max().replace(hour=0, minute=0, second=0, microsecond=0) 
-                        date_from = st.date_input("Desde:", value=min_date_global, min_value=min_date_global, max_value=max_date_global, key='filter_date_from')
+                        # Mín/máx del manifiesto del histórico (sin cargar ninguna partición). Por defecto se ven
+                        # solo los últimos meses: la ventana completa se elige a mano
+                        min_date_global = historico.fecha_min
+                        max_date_global = historico.fecha_max
+                        date_from = st.date_input("Desde:", value=historico.fecha_inicial, min_value=min_date_global, max_value=max_date_global, key='filter_date_from')
                     
                     with col_hasta: 
                         date_to = st.date_input("Hasta:", value=max_date_global, min_value=min_date_global, max_value=max_date_global, key='filter_date_to')
@@ -591,13 +586,10 @@ else:
                     if date_from > date_to: 
                         st.error("⚠️ Fecha 'Desde' mayor que 'Hasta'."); st.stop()
                     
-                    # Filtro inicial de fecha para calcular el dominio de opciones
-                    filtro_inicio = pd.to_datetime(date_from) 
-                    filtro_fin = pd.to_datetime(date_to) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
-                    df_base_fecha = datos_base_limpia[
-                        (datos_base_limpia[COL_TEMP_DATETIME] >= filtro_inicio) & 
-                        (datos_base_limpia[COL_TEMP_DATETIME] <= filtro_fin)
-                    ].copy()
+                    # Solo se cargan e indexan los meses que se solapan con la ventana (base cacheada por histórico)
+                    base_indexada = historico.base(date_from, date_to)
+                    # Rango de fechas = tramo contiguo de la base ordenada (searchsorted en el índice de días, sin copia)
+                    tramo_fechas = base_indexada.temporal.posiciones(date_from, date_to)
 
                     # --- LÓGICA DE FILTRO CRUZADO ---
                     # Para que los filtros se influyan entre sí, las opciones de cada filtro se calculan 
@@ -611,53 +603,21 @@ else:
                     s_tcn = st.session_state.get('multiselect_tecnologia', [])
                     s_man = st.session_state.get('multiselect_tipo_manual', [])
 
-                    # 1. OPCIONES CIUDAD (Filtradas por: Técnico, Estado, Tipo Orden, Tecnología, Manual)
-                    df_c = apply_filter(df_base_fecha, COL_FILTRO_TECNICO, s_tec)
-                    df_c = apply_filter(df_c, COL_FILTRO_ESTADO, s_est)
-                    df_c = apply_filter(df_c, COL_FILTRO_TIPO_ORDEN, s_tip)
-                    df_c = apply_filter(df_c, COL_FILTRO_TECNOLOGIA, s_tcn)
-                    df_c = apply_filter(df_c, COL_FILTRO_TIPO_MANUAL, s_man)
-                    opciones_ciudad = get_multiselect_options(df_c, COL_FILTRO_CIUDAD)
-
-                    # 2. OPCIONES TÉCNICO (Filtradas por: Ciudad, Estado, Tipo Orden, Tecnología, Manual)
-                    df_t = apply_filter(df_base_fecha, COL_FILTRO_CIUDAD, s_ciu)
-                    df_t = apply_filter(df_t, COL_FILTRO_ESTADO, s_est)
-                    df_t = apply_filter(df_t, COL_FILTRO_TIPO_ORDEN, s_tip)
-                    df_t = apply_filter(df_t, COL_FILTRO_TECNOLOGIA, s_tcn)
-                    df_t = apply_filter(df_t, COL_FILTRO_TIPO_MANUAL, s_man)
-                    opciones_tecnico = get_multiselect_options(df_t, COL_FILTRO_TECNICO)
-
-                    # 3. OPCIONES ESTADO (Filtradas por: Ciudad, Técnico, Tipo Orden, Tecnología, Manual)
-                    df_e = apply_filter(df_base_fecha, COL_FILTRO_CIUDAD, s_ciu)
-                    df_e = apply_filter(df_e, COL_FILTRO_TECNICO, s_tec)
-                    df_e = apply_filter(df_e, COL_FILTRO_TIPO_ORDEN, s_tip)
-                    df_e = apply_filter(df_e, COL_FILTRO_TECNOLOGIA, s_tcn)
-                    df_e = apply_filter(df_e, COL_FILTRO_TIPO_MANUAL, s_man)
-                    opciones_estado = get_multiselect_options(df_e, COL_FILTRO_ESTADO)
-
-                    # 4. OPCIONES TIPO ORDEN (Filtradas por: Ciudad, Técnico, Estado, Tecnología, Manual)
-                    df_o = apply_filter(df_base_fecha, COL_FILTRO_CIUDAD, s_ciu)
-                    df_o = apply_filter(df_o, COL_FILTRO_TECNICO, s_tec)
-                    df_o = apply_filter(df_o, COL_FILTRO_ESTADO, s_est)
-                    df_o = apply_filter(df_o, COL_FILTRO_TECNOLOGIA, s_tcn)
-                    df_o = apply_filter(df_o, COL_FILTRO_TIPO_MANUAL, s_man)
-                    opciones_tipo_orden = get_multiselect_options(df_o, COL_FILTRO_TIPO_ORDEN)
-
-                    # 5. OPCIONES TECNOLOGÍA (Filtradas por: Ciudad, Técnico, Estado, Tipo Orden, Manual)
-                    df_te = apply_filter(df_base_fecha, COL_FILTRO_CIUDAD, s_ciu)
-                    df_te = apply_filter(df_te, COL_FILTRO_TECNICO, s_tec)
-                    df_te = apply_filter(df_te, COL_FILTRO_ESTADO, s_est)
-                    df_te = apply_filter(df_te, COL_FILTRO_TIPO_ORDEN, s_tip)
-                    df_te = apply_filter(df_te, COL_FILTRO_TIPO_MANUAL, s_man)
-                    opciones_tecnologia = get_multiselect_options(df_te, COL_FILTRO_TECNOLOGIA)
-
-                    # 6. OPCIONES TIPO MANUAL (Filtradas por: Ciudad, Técnico, Estado, Tipo Orden, Tecnología)
-                    df_m = apply_filter(df_base_fecha, COL_FILTRO_CIUDAD, s_ciu)
-                    df_m = apply_filter(df_m, COL_FILTRO_TECNICO, s_tec)
-                    df_m = apply_filter(df_m, COL_FILTRO_ESTADO, s_est)
-                    df_m = apply_filter(df_m, COL_FILTRO_TIPO_ORDEN, s_tip)
-                    df_m = apply_filter(df_m, COL_FILTRO_TECNOLOGIA, s_tcn)
-                    opciones_tipo_manual = get_multiselect_options(df_m, COL_FILTRO_TIPO_MANUAL)
+                    # Índice de bitmaps: para cada filtro, AND de los OR de las selecciones de los otros cinco
+                    # (más el tramo de fechas) y popcount por valor candidato
+                    selecciones_previas = {
+                        COL_FILTRO_CIUDAD: s_ciu, COL_FILTRO_TECNICO: s_tec, COL_FILTRO_ESTADO: s_est,
+                        COL_FILTRO_TIPO_ORDEN: s_tip, COL_FILTRO_TECNOLOGIA: s_tcn, COL_FILTRO_TIPO_MANUAL: s_man
+                    }
+                    # Memo por (versión del dataset, tramo de fechas, selecciones canónicas): sin hashear DataFrames
+                    clave_opciones = (base_indexada.version, tramo_fechas) + tuple(memo.canonica(v) for v in selecciones_previas.values())
+                    opciones_cruzadas = memo.MEMO.obtener(('opciones', *clave_opciones), lambda: base_indexada.indice.opciones_cruzadas(tramo_fechas, selecciones_previas))
+                    opciones_ciudad = opciones_cruzadas[COL_FILTRO_CIUDAD]
+                    opciones_tecnico = opciones_cruzadas[COL_FILTRO_TECNICO]
+                    opciones_estado = opciones_cruzadas[COL_FILTRO_ESTADO]
+                    opciones_tipo_orden = opciones_cruzadas[COL_FILTRO_TIPO_ORDEN]
+                    opciones_tecnologia = opciones_cruzadas[COL_FILTRO_TECNOLOGIA]
+                    opciones_tipo_manual = opciones_cruzadas[COL_FILTRO_TIPO_MANUAL]
 
                     # --- WIDGETS ---
                     # NOTA: Para preservar los filtros al cambiar las fechas, primero calculamos la intersección
@@ -706,16 +666,17 @@ else:
                             st.markdown(f"<p style='margin-top:2.2rem; font-size: 0.9rem; color: #a0a0a0;'>{COL_TIPO_MANUAL_DESCRIPTIVA}</p>", unsafe_allow_html=True)
 
                     # --- APLICACIÓN FINAL DE FILTROS A LOS DATOS ---
-                    df_final = df_base_fecha.copy()
-                    df_final = apply_filter(df_final, COL_FILTRO_CIUDAD, filtro_ciudad) 
-                    df_final = apply_filter(df_final, COL_FILTRO_TECNICO, filtro_tecnico) 
-                    df_final = apply_filter(df_final, COL_FILTRO_ESTADO, filtro_estado) 
-                    df_final = apply_filter(df_final, COL_FILTRO_TIPO_ORDEN, filtro_tipo_orden) 
-                    df_final = apply_filter(df_final, COL_FILTRO_TECNOLOGIA, filtro_tecnologia) 
-                    if filtro_tipo_manual: 
-                        df_final = apply_filter(df_final, COL_FILTRO_TIPO_MANUAL, filtro_tipo_manual) 
-                    
-                    datos_filtrados = df_final 
+                    # Clave canónica del estado de filtros: todos los resultados derivados se memorizan con ella
+                    clave_filtros = (base_indexada.version, tramo_fechas) + tuple(memo.canonica(v) for v in (
+                        filtro_ciudad, filtro_tecnico, filtro_estado, filtro_tipo_orden, filtro_tecnologia, filtro_tipo_manual))
+
+                    selecciones_finales = {
+                        COL_FILTRO_CIUDAD: filtro_ciudad, COL_FILTRO_TECNICO: filtro_tecnico, COL_FILTRO_ESTADO: filtro_estado,
+                        COL_FILTRO_TIPO_ORDEN: filtro_tipo_orden, COL_FILTRO_TECNOLOGIA: filtro_tecnologia, COL_FILTRO_TIPO_MANUAL: filtro_tipo_manual
+                    }
+                    # Cada etapa produce posiciones de fila sobre la base compartida (no DataFrames): las filas
+                    # solo se materializan donde una salida concreta las necesita (página de la tabla, export)
+                    posiciones_filtradas = memo.MEMO.obtener(('filas', *clave_filtros), lambda: base_indexada.seleccionar(tramo_fechas, selecciones_finales))
 
                 # -----------------------------------------------------------------------------
                 # --- MÉTRICAS --- 
@@ -724,36 +685,28 @@ else:
                     st.markdown("#### 🎯 Métricas Clave (KPIs)") 
                     col_m_sat_abs, col_m_inst_abs, col_m_vis_abs, col_m_mig_abs, col_m_man_abs, col_m_cd_abs, col_m_migratec_abs = st.columns([1,1,1,1,1,1,1])
 
+                    # KPIs desde el cubo de conteos (mismos filtros, sumando celdas en lugar de filas)
+                    celdas_metricas = memo.MEMO.obtener(('celdas', *clave_filtros), lambda: base_indexada.cubo.filtrar(
+                        date_from, date_to, selecciones_finales, filtro_estado[0] if len(filtro_estado) == 1 else None))
+                    totales = memo.MEMO.obtener(('totales', *clave_filtros), lambda: modelo.totales_cubo(celdas_metricas))
+
                     if len(filtro_estado) == 1:
                         estado_base = filtro_estado[0]
-                        datos_base_metricas = datos_filtrados[datos_filtrados[COL_FILTRO_ESTADO] == estado_base].copy()
+                        posiciones_metricas = memo.MEMO.obtener(('base_metricas', *clave_filtros), lambda: base_indexada.seleccionar_base_metricas(posiciones_filtradas, estado_base))
                         etiqueta_estado = f" ({estado_base.title().replace(' ','')[:3]}.)"
                         etiqueta_total_base = f"Total ({estado_base.title().replace(' ','')[:3]}.)"
                     else:
-                        estado_tarea = datos_filtrados[COL_ESTADO_KEY].astype(str)
-                        es_satisfactoria = estado_tarea.str.contains('SATISFACTORIA', case=False, na=False)
-                        es_insatisfactoria = estado_tarea.str.contains('INSATISFACTORIA', case=False, na=False)
-                        datos_base_metricas = datos_filtrados[es_satisfactoria & ~es_insatisfactoria].copy()
+                        posiciones_metricas = memo.MEMO.obtener(('base_metricas', *clave_filtros), lambda: base_indexada.seleccionar_base_metricas(posiciones_filtradas))
                         estado_base = "SATISFACTORIA"
                         etiqueta_estado = " (Sat.)"; etiqueta_total_base = "Total Sat."
 
-                    total_base = len(datos_base_metricas)
-                    
-                    if COL_TIPO_ORDEN_KEY in datos_base_metricas.columns: 
-                        tipo_orden_base = datos_base_metricas[COL_TIPO_ORDEN_KEY].astype(str)
-                        total_instalaciones = len(datos_base_metricas[tipo_orden_base.str.contains('INSTALACION', case=False, na=False)]) 
-                        total_visitas_tecnicas = len(datos_base_metricas[tipo_orden_base.str.contains('VISITA TECNICA', case=False, na=False)])
-                        mask_migracion_orden = tipo_orden_base.str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-                        mask_migracion_manual = False
-                        if COL_TIPO_MANUAL_KEY in datos_base_metricas.columns:
-                            mask_migracion_manual = datos_base_metricas[COL_TIPO_MANUAL_KEY].astype(str).str.contains(r'MIGRACI[ÓO]N', case=False, na=False, regex=True)
-                        total_migracion = len(datos_base_metricas[mask_migracion_orden | mask_migracion_manual])
-                        total_tarea_manual = len(datos_base_metricas[tipo_orden_base.str.contains('TAREA MANUAL', case=False, na=False)])
-                        total_cambio_direccion = len(datos_base_metricas[tipo_orden_base.str.contains(r'CAMBIO DE DIRECCI[ÓO]N', case=False, na=False, regex=True)])
-                        total_migratec = len(datos_base_metricas[tipo_orden_base.str.contains('MIGRATEC', case=False, na=False)])
-                    else: 
-                        total_instalaciones = 0; total_visitas_tecnicas = 0; total_migracion = 0 
-                        total_tarea_manual = 0; total_cambio_direccion = 0; total_migratec = 0
+                    total_base = totales['Total_Tareas']
+                    total_instalaciones = totales['Total_Instalaciones']
+                    total_visitas_tecnicas = totales['Total_Visitas']
+                    total_migracion = totales['Total_Migracion']
+                    total_tarea_manual = totales['Total_TareaManual']
+                    total_cambio_direccion = totales['Total_CambioDireccion']
+                    total_migratec = totales['Total_MigraTec']
                     
                     def metric_card(col, label, val, is_total=False):
                         css_class = "metric-compact-container-total" if is_total else "metric-compact-container"
@@ -771,7 +724,7 @@ else:
                     metric_card(col_m_migratec_abs, f"MigraTec{etiqueta_estado}", total_migratec)
                         
                 st.markdown("---")
-                datos_filtrados = datos_base_metricas.copy() 
+                posiciones = posiciones_metricas
                 
                 # ------------------------------------------------------------------------------------- 
                 # --- LAYOUT PRINCIPAL --- 
@@ -780,30 +733,7 @@ else:
 
                 # --- COLUMNA 1: TABLA RAW --- 
                 with col_raw:
-                    st.markdown(f"#### 📑 Datos ({len(datos_filtrados)})")
-                    datos_filtrados_ordenados = datos_filtrados.sort_values(by=COL_TEMP_DATETIME, ascending=True).copy()
-                    datos_vista = datos_filtrados_ordenados.rename(columns=FINAL_RENAMING_MAP) 
-                    columnas_finales = [col for col in FINAL_RENAMING_MAP.values() if col in datos_vista.columns] 
-                    if COL_FILTRO_TECNICO in datos_filtrados_ordenados.columns and FINAL_RENAMING_MAP['C'] in datos_vista.columns:
-                         datos_vista[FINAL_RENAMING_MAP['C']] = datos_filtrados_ordenados[COL_FILTRO_TECNICO]
-                    datos_vista = datos_vista[columnas_finales]
-
-                    all_cols = datos_vista.columns.tolist() 
-                    default_cols_raw = [FINAL_RENAMING_MAP['A'], FINAL_RENAMING_MAP['B'], FINAL_RENAMING_MAP['C'], FINAL_RENAMING_MAP['G']]
-                    default_cols = [c for c in default_cols_raw if c in all_cols]
-
-                    cols_to_show = st.multiselect("**Columnas**:", options=all_cols, default=default_cols, key='raw_table_col_select')
-                    df_to_display = datos_vista[cols_to_show] if cols_to_show else datos_vista
-
-                    st.markdown('<div style="overflow-x: auto;">', unsafe_allow_html=True) 
-                    st.data_editor(df_to_display, use_container_width=True, hide_index=True, key='editable_raw', num_rows="fixed") 
-                    st.markdown('</div>', unsafe_allow_html=True)
-
-                    # Export
-                    excel_buffer = io.BytesIO()
-                    datos_filtrados.rename(columns=FINAL_RENAMING_MAP).to_excel(excel_buffer, index=False)
-                    excel_buffer.seek(0)
-                    st.download_button(label="⬇️ Excel Filtrado", data=excel_buffer, file_name='data.xlsx', mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', use_container_width=True)
+                    render_tabla_datos(base_indexada, posiciones, clave_filtros)
 
                 # --- COLUMNA 2: GRÁFICOS --- 
                 with col_graphs_group: 
@@ -814,8 +744,8 @@ else:
                     with col_graphs_izq:
                         with st.container(border=True):
                             st.markdown(f"#### Por Tecnología (Base: {estado_base.title()})") 
-                            if len(datos_filtrados) > 0 and COL_AGRUPACION_KEY in datos_filtrados.columns:
-                                conteo_tecnologia = datos_filtrados[COL_AGRUPACION_KEY].value_counts().reset_index()
+                            if len(posiciones) > 0 and COL_AGRUPACION_KEY in base_indexada.datos.columns:
+                                conteo_tecnologia = base_indexada.columna(COL_AGRUPACION_KEY, posiciones).value_counts().reset_index()
                                 conteo_tecnologia.columns = [COL_AGRUPACION_DESCRIPTIVA, 'Total_Tareas']
                                 fig = px.bar(conteo_tecnologia, x=COL_AGRUPACION_DESCRIPTIVA, y='Total_Tareas', text='Total_Tareas', color=COL_AGRUPACION_DESCRIPTIVA, color_discrete_sequence=['#4CAF50', '#2196F3', '#FF9800'])
                                 fig.update_layout(xaxis_title=None, yaxis_title=None, margin=dict(t=20, b=10, l=10, r=10), height=200)
@@ -837,10 +767,12 @@ else:
                                 st.markdown(f"#### Distribución Ubicación") 
                                 group_col = COL_FILTRO_CIUDAD
 
-                            if group_col in datos_filtrados.columns and len(datos_filtrados) > 0: 
-                                conteo = datos_filtrados[group_col].value_counts().reset_index() 
+                            if group_col in base_indexada.datos.columns and len(posiciones) > 0: 
+                                conteo = base_indexada.columna(group_col, posiciones).value_counts() 
+                                conteo = conteo[conteo > 0].reset_index() # categóricas: sin categorías vacías
                                 conteo.columns = ['Label', 'Total']
                                 if is_single_city: conteo = conteo.head(5)
+                                else: conteo = modelo.top_n_con_otros(conteo, 'Label', ['Total'], TOP_N_CATEGORIAS, 'Total')
                                 fig_pie = px.pie(conteo, values='Total', names='Label', hole=.4, color_discrete_sequence=px.colors.qualitative.Pastel) 
                                 fig_pie.update_traces(textposition='inside', textinfo='percent+label')
                                 fig_pie.update_layout(showlegend=True, margin=dict(l=0, r=0, t=20, b=0), height=200)
@@ -865,7 +797,7 @@ else:
                         st.markdown(f"### 📈 Rendimiento Filtrado: **{titulo_grafico}**")
                         
                         with st.container(border=True):
-                            if datos_filtrados.empty:
+                            if len(posiciones) == 0:
                                 st.info("No hay datos para los filtros seleccionados.")
                             else:
                                 # Determinar eje X (Agrupación)
@@ -873,8 +805,6 @@ else:
                                     # 1 Técnico -> Ver evolución por FECHA
                                     group_col = '_FECHA_DIA_'
                                     label_x = "Fecha"
-                                    # Asegurar columna fecha día en datos filtrados para agrupar
-                                    datos_filtrados['_FECHA_DIA_'] = datos_filtrados[COL_TEMP_DATETIME].dt.date
                                     es_temporal = True
                                 elif len(filtro_tecnico) > 1:
                                     # Varios Técnicos (o Todos) -> Comparar TÉCNICOS
@@ -893,11 +823,15 @@ else:
                                     es_temporal = False
 
                                 # Agrupar y Contar
-                                df_unico = datos_filtrados.groupby(group_col).size().reset_index(name='Total_Tareas')
+                                # Solo la columna de agrupación de las filas seleccionadas
+                                if es_temporal: valores_grupo = base_indexada.columna(COL_TEMP_DATETIME, posiciones).dt.date.rename(group_col)
+                                else: valores_grupo = base_indexada.columna(group_col, posiciones)
+                                df_unico = valores_grupo.groupby(valores_grupo, observed=True).size().reset_index(name='Total_Tareas')
                                 
                                 # Ordenar
                                 if not es_temporal:
                                     df_unico = df_unico.sort_values(by='Total_Tareas', ascending=False)
+                                    df_unico = modelo.top_n_con_otros(df_unico, group_col, ['Total_Tareas'], TOP_N_CATEGORIAS, 'Total_Tareas')
                                 else:
                                     df_unico = df_unico.sort_values(by=group_col, ascending=True)
 
@@ -906,7 +840,9 @@ else:
                                 color_u = '#2196F3' # Azul estándar para el gráfico único
                                 
                                 if es_temporal:
-                                    fig_u = px.line(df_unico, x=group_col, y='Total_Tareas', markers=True, text='Total_Tareas', height=height_u, color_discrete_sequence=[color_u])
+                                    denso = len(df_unico) > PUNTOS_WEBGL
+                                    fig_u = px.line(df_unico, x=group_col, y='Total_Tareas', markers=True, text=None if denso else 'Total_Tareas', height=height_u,
+                                                    color_discrete_sequence=[color_u], render_mode='webgl' if denso else 'auto')
                                 else:
                                     # Usar Barras para comparación entre técnicos/ciudades (es más claro para volúmenes)
                                     fig_u = px.bar(df_unico, x=group_col, y='Total_Tareas', text='Total_Tareas', height=height_u, color_discrete_sequence=[color_u])
@@ -924,18 +860,4 @@ else:
 
                     else:
                         # --- MODO ESTÁNDAR: 6 GRÁFICOS (Instalación, Visita, etc.) ---
-                        st.markdown(f"### 📈 Rendimiento Detallado (Base: {estado_base.title()})")
-                        with st.container(border=True): 
-                            if len(filtro_tecnico) == 1:
-                                df_comparacion_view = prepare_date_comparison_data(datos_filtrados) 
-                                x_col, title, is_city_view = '_FECHA_DIA_', f"por Día: **{filtro_tecnico[0]}**", False
-                            elif len(filtro_tecnico) > 1:
-                                df_comparacion_view = prepare_technician_comparison_data(datos_filtrados) 
-                                x_col, title, is_city_view = COL_FILTRO_TECNICO, "por Técnico", False 
-                            else:
-                                df_comparacion_view = prepare_city_comparison_data(datos_filtrados) 
-                                x_col, title, is_city_view = COL_FILTRO_CIUDAD, "por Ubicación", True
-                            
-                            if not df_comparacion_view.empty: 
-                                render_comparison_charts_vertical(df_comparacion_view, x_col, title, is_city_view) 
-                            else: st.info("No hay datos de rendimiento.")
\ No newline at end of file
+                        render_rendimiento(celdas_metricas, clave_filtros, filtro_tecnico, estado_base, date_from, date_to)
\ No newline at end of file
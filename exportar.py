@@ -0,0 +1,56 @@
+import io
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+# --- EXPORTACIÓN BAJO DEMANDA ---
+# El archivo solo se genera cuando el usuario lo pide (no en cada rerun). El xlsx se escribe con el
+# modo write-only de openpyxl, fila a fila y por bloques, sin construir el libro completo en memoria.
+FILAS_POR_BLOQUE = 10000
+FORMATOS_EXPORTACION = {
+    'Excel (.xlsx)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/octet-stream'),
+}
+
+
+def valor_celda(valor):
+    # openpyxl no acepta NaN/NaT ni escalares de numpy en todas las versiones
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)): return None
+    if isinstance(valor, pd.Timestamp): return valor.to_pydatetime()
+    if isinstance(valor, np.generic): return valor.item()
+    return valor
+
+
+def exportar_xlsx(df):
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append([str(c) for c in df.columns])
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        for fila in df.iloc[inicio:inicio + FILAS_POR_BLOQUE].itertuples(index=False, name=None):
+            hoja.append([valor_celda(v) for v in fila])
+    buffer = io.BytesIO()
+    libro.save(buffer)
+    return buffer.getvalue()
+
+
+def exportar_csv(df):
+    # utf-8 con BOM para que Excel reconozca los acentos al abrirlo
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def exportar_parquet(df):
+    # Columnas de texto con tipos mezclados (p.ej. números y texto) -> str, como en la copia columnar
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object: df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def exportar(df, formato):
+    # Devuelve (bytes, extensión, mime)
+    extension, mime = FORMATOS_EXPORTACION[formato]
+    generador = {'xlsx': exportar_xlsx, 'csv': exportar_csv, 'parquet': exportar_parquet}[extension]
+    return generador(df), extension, mime
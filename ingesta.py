@@ -0,0 +1,316 @@
+import os
+import json
+import codecs
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# --- CONFIGURACIÓN DE INGESTA ---
+EXTENSIONES_DATOS = ('.xlsx', '.xls', '.csv')
+TAMANO_BLOQUE_HASH = 1024 * 1024
+SUBCARPETA_COLUMNAR = '.columnar'
+# Se incrementa cuando cambia cómo se tipan las columnas: las copias Parquet de otro formato se regeneran
+FORMATO_COLUMNAR = 4
+# Arrancar un proceso 'spawn' cuesta ~1-2 s (importar pandas): por debajo de este volumen
+# pendiente de parsear sale más barato hacerlo en serie
+UMBRAL_BYTES_POOL = 8 * 1024 * 1024
+COLUMNA_FECHA = 'A'
+
+# --- CACHÉ DE INGESTA POR ARCHIVO ---
+# Vive a nivel de proceso (app.py se re-ejecuta en cada rerun, este módulo no), por lo que
+# todas las sesiones comparten las lecturas. Clave: ruta -> (tamaño, mtime, hash de contenido).
+# - Si tamaño y mtime no cambiaron, se reutiliza la lectura sin tocar el archivo.
+# - Si cambiaron, se recalcula el hash: mismo contenido -> se reutiliza; distinto -> se re-lee.
+_CACHE_INGESTA = {}
+_LOCK_CACHE = threading.Lock()
+
+
+def listar_archivos_datos(carpeta):
+    return sorted(f for f in os.listdir(carpeta) if f.lower().endswith(EXTENSIONES_DATOS))
+
+
+def firma_archivos(rutas):
+    # Firma barata (solo stat) del conjunto de archivos: cambia si se agrega, borra o modifica alguno
+    firma = []
+    for ruta in rutas:
+        try: stat = os.stat(ruta)
+        except OSError: continue
+        firma.append((ruta, stat.st_size, stat.st_mtime_ns))
+    return tuple(firma)
+
+
+def hash_contenido(ruta):
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, 'rb') as fh:
+        for bloque in iter(lambda: fh.read(TAMANO_BLOQUE_HASH), b''): h.update(bloque)
+    return h.hexdigest()
+
+
+# --- NORMALIZACIÓN DE ENCABEZADOS Y MAPEO ---
+def normalizar_encabezados(columnas):
+    # Mayúsculas + strip; los duplicados se sufijan con _2, _3, ...
+    cleaned_names = []
+    name_counts = {}
+    for name in columnas:
+        cleaned_name = str(name).upper().strip()
+        name_counts[cleaned_name] = name_counts.get(cleaned_name, 0) + 1
+        if name_counts[cleaned_name] > 1: cleaned_name = f"{cleaned_name}_{name_counts[cleaned_name]}"
+        cleaned_names.append(cleaned_name)
+    return cleaned_names
+
+
+# --- DETECCIÓN DE ESQUEMA (SOLO ENCABEZADOS) ---
+# Antes del parseo completo se lee únicamente la fila de encabezados (nrows=0: openpyxl en modo
+# read-only para Excel, primera línea para CSV), se resuelve el mapeo con la misma normalización
+# (mayúsculas, strip, sufijos _2...) y luego se parsean solo las columnas mapeadas, con dtype explícito.
+# Los archivos sin ninguna columna mapeable se descartan sin llegar a parsearlos.
+def es_csv(ruta):
+    return ruta.lower().endswith('.csv')
+
+
+def leer_encabezados(ruta, codificacion=None):
+    return list(pd.read_csv(ruta, encoding=codificacion, nrows=0).columns if es_csv(ruta) else pd.read_excel(ruta, nrows=0).columns)
+
+
+def resolver_esquema(encabezados, mapeo):
+    # Devuelve {posición en el archivo: columna final} solo para los encabezados mapeados
+    posiciones = {nombre: i for i, nombre in enumerate(normalizar_encabezados(encabezados))}
+    return {posiciones[enc]: final for enc, final in mapeo.items() if enc in posiciones}
+
+
+def leer_archivo(ruta, mapeo):
+    # Devuelve (df con columnas A..J o None, nº de columnas encontradas, codificación del CSV o None)
+    codificacion = detectar_codificacion(ruta) if es_csv(ruta) else None
+    encabezados = leer_encabezados(ruta, codificacion)
+    esquema = resolver_esquema(encabezados, mapeo)
+    if not esquema: return None, 0, codificacion
+    usecols = sorted(esquema)
+    if es_csv(ruta): df, codificacion = leer_csv(ruta, len(encabezados), usecols, codificacion)
+    else:
+        # Texto como str (los números de contrato/tarea incluidos); la fecha se tipa después.
+        # Las claves enteras de dtype son posiciones dentro de usecols, no en el archivo.
+        df = pd.read_excel(ruta, usecols=usecols, dtype={j: str for j, i in enumerate(usecols) if esquema[i] != COLUMNA_FECHA})
+    df.columns = [esquema[i] for i in usecols]
+    return df.reindex(columns=list(mapeo.values()), fill_value=None), len(esquema), codificacion
+
+
+# --- LECTURA DE CSV ---
+# La codificación se detecta una sola vez a partir de una muestra de bytes (utf-8 estricto, con o sin BOM;
+# si no decodifica, latin1) y queda registrada en la copia Parquet del archivo. El parseo usa el lector
+# en streaming de pyarrow por bloques de tamaño acotado, solo con las columnas mapeadas y todas como texto.
+# Cada bloque se codifica como diccionario en cuanto se lee (códigos + valores distintos del bloque) y el
+# texto del bloque se libera: las columnas llegan a pandas como categóricas, sin pasar por object.
+MUESTRA_CODIFICACION = 64 * 1024
+BLOQUE_CSV = 16 * 1024 * 1024
+FILAS_BLOQUE_CSV = 200000
+# Los mismos marcadores de nulo que pd.read_csv por defecto ('N/A', 'NULL', '', ...)
+VALORES_NULOS_CSV = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                     '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def detectar_codificacion(ruta):
+    with open(ruta, 'rb') as fh: muestra = fh.read(MUESTRA_CODIFICACION)
+    if muestra.startswith(codecs.BOM_UTF8): return 'utf-8-sig'
+    # final=False: un carácter multibyte cortado al final de la muestra no cuenta como error
+    try: codecs.getincrementaldecoder('utf-8')().decode(muestra, final=False)
+    except UnicodeDecodeError: return 'latin1'
+    return 'utf-8'
+
+
+def unir_categoricas(trozos, columnas):
+    # Une bloques de columnas categóricas sin pasar por object (categorías en orden de aparición)
+    if not trozos: return pd.DataFrame({c: pd.Series(dtype='category') for c in columnas})
+    return pd.DataFrame({c: union_categoricals([t[c] for t in trozos]) for c in trozos[0].columns})
+
+
+def leer_csv(ruta, num_columnas, usecols, codificacion):
+    # Devuelve (df con las columnas usecols en orden de archivo y tipo categórico, codificación usada).
+    # Nombres propios por posición: los encabezados originales pueden repetirse.
+    nombres = [f'c{i}' for i in range(num_columnas)]
+    incluidas = [nombres[i] for i in usecols]
+    try:
+        lector = pacsv.open_csv(ruta,
+            read_options=pacsv.ReadOptions(column_names=nombres, skip_rows=1, block_size=BLOQUE_CSV,
+                                           encoding='utf8' if codificacion == 'utf-8-sig' else codificacion),
+            convert_options=pacsv.ConvertOptions(include_columns=incluidas, column_types={c: pa.string() for c in incluidas},
+                                                 null_values=VALORES_NULOS_CSV, strings_can_be_null=True))
+        lotes = [pa.record_batch([pc.dictionary_encode(columna) for columna in lote.columns], names=lote.schema.names)
+                 for lote in lector]
+        if not lotes: return unir_categoricas([], incluidas), codificacion
+        # to_pandas unifica los diccionarios de todos los bloques en una sola tabla de categorías
+        return pa.Table.from_batches(lotes).to_pandas(), codificacion
+    except pa.ArrowInvalid: pass
+    # Filas con un número de campos distinto al del encabezado, utf-8 inválido más allá de la muestra, etc.:
+    # lector de pandas por bloques, cada uno pasado a categórica en cuanto se lee (y, si tampoco decodifica, latin1)
+    try:
+        trozos = [t.astype('category') for t in pd.read_csv(ruta, encoding=codificacion, usecols=usecols, dtype=str, chunksize=FILAS_BLOQUE_CSV)]
+        return unir_categoricas(trozos, incluidas), codificacion
+    except UnicodeDecodeError:
+        if codificacion == 'latin1': raise
+        return leer_csv(ruta, num_columnas, usecols, 'latin1')
+
+
+# --- TIPADO Y COPIA COLUMNAR (PARQUET) ---
+# Al guardar un archivo se escribe además una copia Parquet con solo las columnas A..J ya
+# tipadas (A como fecha, texto como str). Leer esa copia es mucho más rápido que openpyxl.
+def tipar_columnas(df):
+    df = df.copy()
+    for col in df.columns:
+        if col == COLUMNA_FECHA: df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif df[col].dtype == object: df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def ruta_columnar(ruta):
+    return os.path.join(os.path.dirname(ruta), SUBCARPETA_COLUMNAR, os.path.basename(ruta) + '.parquet')
+
+
+def escribir_columnar(ruta, df, columnas_encontradas, huella):
+    destino = ruta_columnar(ruta)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(tabla.schema.metadata or {})
+    meta[b'isertel'] = json.dumps({**huella, 'columnas_encontradas': columnas_encontradas, 'formato': FORMATO_COLUMNAR}).encode()
+    temporal = destino + '.tmp'
+    pq.write_table(tabla.replace_schema_metadata(meta), temporal)
+    os.replace(temporal, destino)
+
+
+def asegurar_hash(ruta, huella):
+    if huella['hash'] is None: huella['hash'] = hash_contenido(ruta)
+    return huella['hash']
+
+
+def leer_columnar(ruta, huella):
+    # Devuelve (df, columnas_encontradas) si la copia existe y corresponde a la huella del origen
+    destino = ruta_columnar(ruta)
+    if not os.path.exists(destino): return None
+    try:
+        meta = json.loads((pq.read_schema(destino).metadata or {}).get(b'isertel', b'{}'))
+        if meta.get('mapeo') != huella['mapeo'] or meta.get('formato') != FORMATO_COLUMNAR: return None
+        mismo_stat = (meta.get('tamano'), meta.get('mtime')) == (huella['tamano'], huella['mtime'])
+        if not mismo_stat and meta.get('hash') != asegurar_hash(ruta, huella): return None
+        df = pq.read_table(destino).to_pandas()
+    except Exception: return None
+    # pyarrow devuelve None en los nulos de texto; se unifica con NaN como en la lectura de Excel
+    for col in df.columns:
+        if df[col].dtype == object: df[col] = df[col].where(df[col].notna(), np.nan)
+    return df, meta.get('columnas_encontradas', 0)
+
+
+# --- LECTURA CON CACHÉ ---
+def consultar_cache(ruta, clave_mapeo):
+    # Devuelve (resultado o None, huella). Orden: memoria -> copia Parquet.
+    stat = os.stat(ruta)
+    huella = {'tamano': stat.st_size, 'mtime': stat.st_mtime_ns, 'mapeo': clave_mapeo, 'hash': None}
+    with _LOCK_CACHE: entrada = _CACHE_INGESTA.get(ruta)
+
+    if entrada is not None and entrada['huella']['mapeo'] == clave_mapeo:
+        previa = entrada['huella']
+        if (previa['tamano'], previa['mtime']) == (huella['tamano'], huella['mtime']): return entrada['resultado'], previa
+        if previa['hash'] == asegurar_hash(ruta, huella):
+            guardar_en_cache(ruta, huella, entrada['resultado'])
+            return entrada['resultado'], huella
+    columnar = leer_columnar(ruta, huella)
+    if columnar is not None:
+        guardar_en_cache(ruta, huella, (*columnar, None))
+        return (*columnar, None), huella
+    return None, huella
+
+
+def guardar_en_cache(ruta, huella, resultado):
+    with _LOCK_CACHE: _CACHE_INGESTA[ruta] = {'huella': huella, 'resultado': resultado}
+
+
+def parsear_archivo(ruta, mapeo, huella):
+    # Parseo completo del archivo original + escritura de su copia Parquet.
+    # Función de nivel de módulo para que pueda ejecutarse en los procesos del pool.
+    try:
+        df_temp, columnas_encontradas, codificacion = leer_archivo(ruta, mapeo)
+        if df_temp is not None:
+            df_temp = tipar_columnas(df_temp)
+            escribir_columnar(ruta, df_temp, columnas_encontradas, {**huella, 'hash': asegurar_hash(ruta, huella), 'codificacion': codificacion})
+        return df_temp, columnas_encontradas, None
+    except Exception as e: return None, 0, e
+
+
+# --- POOL DE PROCESOS ---
+# openpyxl es Python puro y limitado por CPU: los archivos que no están en caché se parsean en
+# paralelo. Se usa 'spawn' porque el servidor de Streamlit tiene hilos vivos (fork no es seguro).
+# El pool vive solo durante el lote para no dejar procesos ociosos ocupando memoria.
+def parsear_pendientes(pendientes, mapeo, workers, progreso=None):
+    # pendientes: [(ruta, huella)]. El resultado mantiene el orden de entrada.
+    # progreso(ruta) se llama cada vez que termina un archivo.
+    avisar = progreso or (lambda ruta: None)
+    volumen = sum(huella['tamano'] for _, huella in pendientes)
+    resultados = []
+    if workers <= 1 or len(pendientes) <= 1 or volumen < UMBRAL_BYTES_POOL:
+        for ruta, huella in pendientes:
+            resultados.append(parsear_archivo(ruta, mapeo, huella)); avisar(ruta)
+        return resultados
+    try:
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(pendientes)), mp_context=contexto) as pool:
+            futuros = [pool.submit(parsear_archivo, ruta, mapeo, huella) for ruta, huella in pendientes]
+            for (ruta, _), futuro in zip(pendientes, futuros):
+                try: resultados.append(futuro.result())
+                except BrokenProcessPool: raise
+                except Exception as e: resultados.append((None, 0, e))
+                avisar(ruta)
+    except (BrokenProcessPool, OSError):
+        # Sin posibilidad de crear procesos (o un worker murió): se completa en serie
+        for ruta, huella in pendientes[len(resultados):]:
+            resultados.append(parsear_archivo(ruta, mapeo, huella)); avisar(ruta)
+    return resultados
+
+
+def cargar_archivos(rutas, mapeo, workers=1, progreso=None):
+    # Devuelve [(df, columnas_encontradas, error)] en el mismo orden que `rutas`.
+    # progreso(ruta, hechos, total) se llama por cada archivo que hubo que parsear, al terminarlo.
+    # Los errores también se cachean para no re-intentar en cada rerun un archivo que no ha cambiado.
+    # Los DataFrames devueltos son compartidos entre sesiones: NO modificar in-place.
+    clave_mapeo = [list(par) for par in mapeo.items()]
+    resultados = {}
+    pendientes = []
+    for ruta in rutas:
+        resultado, huella = consultar_cache(ruta, clave_mapeo)
+        if resultado is not None: resultados[ruta] = resultado
+        else:
+            asegurar_hash(ruta, huella)
+            pendientes.append((ruta, huella))
+    hechos = [0]
+    def avisar(ruta):
+        hechos[0] += 1
+        if progreso is not None: progreso(ruta, hechos[0], len(pendientes))
+    for (ruta, huella), resultado in zip(pendientes, parsear_pendientes(pendientes, mapeo, workers, avisar)):
+        guardar_en_cache(ruta, huella, resultado)
+        resultados[ruta] = resultado
+    return [resultados[ruta] for ruta in rutas]
+
+
+def descartar_archivo(ruta):
+    with _LOCK_CACHE: _CACHE_INGESTA.pop(ruta, None)
+
+
+def eliminar_archivo(ruta):
+    # Borra el archivo fuente, su copia columnar y su entrada en caché
+    if os.path.exists(ruta): os.remove(ruta)
+    destino = ruta_columnar(ruta)
+    if os.path.exists(destino): os.remove(destino)
+    descartar_archivo(ruta)
+
+
+def podar_cache(rutas_vigentes):
+    # Elimina entradas de archivos que ya no existen en la carpeta (p.ej. borrados fuera de la app)
+    vigentes = set(rutas_vigentes)
+    with _LOCK_CACHE:
+        for ruta in [r for r in _CACHE_INGESTA if r not in vigentes]: del _CACHE_INGESTA[ruta]
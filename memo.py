@@ -0,0 +1,67 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# --- MEMO DE RESULTADOS DERIVADOS ---
+# Sustituye a @st.cache_data en los cálculos sobre la base: en lugar de hashear el DataFrame de entrada
+# en cada llamada, los resultados se buscan por clave = (versión del dataset, nombre del cálculo,
+# estado de filtros canónico). Vive a nivel de proceso (compartido entre sesiones) y se acota por
+# número de entradas y por bytes (LRU). Los valores devueltos son compartidos: NO modificar in-place.
+MEMO_MAX_ENTRADAS = int(os.getenv("MEMO_MAX_ENTRADAS", 256))
+MEMO_MAX_BYTES = int(os.getenv("MEMO_MAX_MB", 512)) * 1024 * 1024
+
+
+def tamano_aproximado(valor):
+    # deep=True: en columnas object/str cuenta cada string, no solo el puntero (en categóricas solo recorre
+    # las categorías). Sin eso una tabla de texto cacheada se subestima y MEMO_MAX_BYTES no acota nada.
+    if isinstance(valor, pd.DataFrame): return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series): return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, np.ndarray): return int(valor.nbytes)
+    if isinstance(valor, dict): return sys.getsizeof(valor) + sum(tamano_aproximado(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)): return sys.getsizeof(valor) + sum(tamano_aproximado(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+def canonica(seleccion):
+    # Lista de valores seleccionados -> tupla ordenada (el orden de selección no cambia el resultado)
+    return tuple(sorted(str(v) for v in seleccion))
+
+
+class MemoLRU:
+    def __init__(self, max_entradas, max_bytes):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, calcular, tamano=None):
+        # tamano: bytes estimados por quien llama, para valores que tamano_aproximado no sabe medir (figuras)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                return entrada[0]
+        # Se calcula fuera del lock: dos sesiones con la misma clave pueden calcular a la vez (mismo resultado)
+        valor = calcular()
+        if tamano is None: tamano = tamano_aproximado(valor)
+        if tamano > self.max_bytes: return valor
+        with self._lock:
+            previa = self._entradas.pop(clave, None)
+            if previa is not None: self._bytes -= previa[1]
+            self._entradas[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+                self._bytes -= self._entradas.popitem(last=False)[1][1]
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+
+MEMO = MemoLRU(MEMO_MAX_ENTRADAS, MEMO_MAX_BYTES)
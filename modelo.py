@@ -0,0 +1,844 @@
+import os
+import json
+import hashlib
+import time
+import threading
+import itertools
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# CLAVES DE COLUMNA
+COL_FECHA_KEY = 'A'
+COL_TECNICO_KEY = 'C'
+COL_CIUDAD_KEY = 'B'
+COL_TIPO_ORDEN_KEY = 'I'
+COL_ESTADO_KEY = 'H'
+COL_CONTRATO_KEY = 'D'
+COL_CLIENTE_KEY = 'E'
+COL_TAREA_KEY = 'G'
+COL_TECNOLOGIA_KEY = 'F'
+COL_TIPO_MANUAL_KEY = 'J'
+
+COL_TEMP_DATETIME = '_DATETIME_' + COL_FECHA_KEY
+
+# Columnas temporales para filtros
+COL_FILTRO_TECNICO = '_Filtro_Tecnico_'
+COL_FILTRO_CIUDAD = '_Filtro_Ubicacion_'
+COL_FILTRO_ESTADO = '_Filtro_Estado_'
+COL_FILTRO_TIPO_ORDEN = '_Filtro_TipoOrden_'
+COL_FILTRO_TECNOLOGIA = '_Filtro_Tecnologia_'
+COL_FILTRO_TIPO_MANUAL = '_Filtro_TipoManual_'
+
+# Clasificación de tipo de orden (y estado) precalculada al cargar como máscara de bits uint8
+COL_FLAGS_TIPO = '_FLAGS_TIPO_'
+BIT_INSTALACION = 1 << 0
+BIT_VISITA = 1 << 1
+BIT_MIGRACION = 1 << 2
+BIT_TAREA_MANUAL = 1 << 3
+BIT_CAMBIO_DIRECCION = 1 << 4
+BIT_MIGRATEC = 1 << 5
+BIT_SATISFACTORIA = 1 << 6  # ESTADO contiene SATISFACTORIA y no INSATISFACTORIA
+
+PATRONES_TIPO_ORDEN = [
+    (BIT_INSTALACION, 'INSTALACION'), (BIT_VISITA, 'VISITA TECNICA'), (BIT_MIGRACION, r'MIGRACI[ÓO]N'),
+    (BIT_TAREA_MANUAL, 'TAREA MANUAL'), (BIT_CAMBIO_DIRECCION, r'CAMBIO DE DIRECCI[ÓO]N'), (BIT_MIGRATEC, 'MIGRATEC')
+]
+
+# --- FUNCIONES DE LIMPIEZA ---
+# Se aplican una sola vez por valor distinto (ver normalizar_por_unicos), nunca fila por fila.
+def clean_tecnico(tecnico):
+    s = str(tecnico).strip()
+    if '|' in s: s = s.split('|', 1)[1].strip()
+    suffix = ' (tecnico)'
+    if s.lower().endswith(suffix): s = s[:-len(suffix)]
+    return s.strip()
+
+def clean_ciudad(ciudad):
+    if isinstance(ciudad, str) and ',' in ciudad: return ciudad.split(',', 1)[0].strip()
+    return str(ciudad).strip()
+
+def clean_mayusculas(valor):
+    return str(valor).upper().strip()
+
+def clean_tipo_manual(valor):
+    s = clean_mayusculas(valor)
+    return 'SIN TIPO MANUAL' if s in ('NAN', 'NONE') else s
+
+
+def factorizar_texto(serie):
+    # (códigos, valores distintos) de serie.astype(str) sin materializarlo. En categóricas (CSV) se trabaja
+    # sobre la tabla de categorías; el nulo pasa a ser un valor más ('nan'), como con astype(str).
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        unicos = np.append(serie.cat.categories.astype(str).to_numpy(dtype=object), 'nan')
+        codigos = serie.cat.codes.to_numpy()
+        return np.where(codigos < 0, len(unicos) - 1, codigos), unicos
+    valores = serie if pd.api.types.is_numeric_dtype(serie.dtype) else serie.astype(str)
+    return pd.factorize(valores, use_na_sentinel=False)
+
+
+def normalizar_por_unicos(serie, funcion):
+    # factorize -> limpiar cada valor distinto -> re-codificar. Devuelve un Categorical: códigos por fila
+    # + tabla de categorías (ordenadas, para que sort/groupby den el mismo orden que con strings).
+    # Salvo en columnas numéricas se factoriza el .astype(str) (conversión en C): factorize une None/NaN
+    # y 12/12.0, y las fechas tienen su propio formato de texto.
+    codigos, unicos = factorizar_texto(serie)
+    limpios = pd.Index([funcion(str(u)) for u in unicos])
+    categorias = pd.Index(sorted(set(limpios)))
+    return pd.Categorical.from_codes(categorias.get_indexer(limpios)[codigos], categories=categorias)
+
+
+def bits_por_unicos(serie, patrones):
+    # Igual que serie.astype(str).str.contains(patron, case=False) pero evaluado una vez por valor distinto
+    codigos, unicos = factorizar_texto(serie)
+    textos = pd.Series([str(u) for u in unicos], dtype=object)
+    bits = np.zeros(len(unicos), dtype=np.uint8)
+    for bit, patron in patrones:
+        bits[textos.str.contains(patron, case=False, na=False, regex=True).to_numpy()] |= bit
+    return bits[codigos]
+
+
+def calcular_flags_tipo(df):
+    flags = np.zeros(len(df), dtype=np.uint8)
+    if COL_TIPO_ORDEN_KEY in df.columns: flags |= bits_por_unicos(df[COL_TIPO_ORDEN_KEY], PATRONES_TIPO_ORDEN)
+    # Migración también cuenta si aparece en el tipo de tarea manual
+    if COL_TIPO_MANUAL_KEY in df.columns: flags |= bits_por_unicos(df[COL_TIPO_MANUAL_KEY], [(BIT_MIGRACION, r'MIGRACI[ÓO]N')])
+    if COL_ESTADO_KEY in df.columns:
+        bits_estado = bits_por_unicos(df[COL_ESTADO_KEY], [(BIT_SATISFACTORIA, 'SATISFACTORIA'), (1, 'INSATISFACTORIA')])
+        flags |= np.where(bits_estado == BIT_SATISFACTORIA, BIT_SATISFACTORIA, 0).astype(np.uint8)
+    return flags
+
+
+def concatenar_particiones(limpias):
+    # Cada partición trae sus propias categorías; se unifican antes del concat para no degradar a object
+    # (solo las que son categóricas en todas: una columna de Excel llega como object y el concat la deja en object)
+    categoricas = [c for c in limpias[0].columns if all(isinstance(p[c].dtype, pd.CategoricalDtype) for p in limpias)]
+    if len(limpias) > 1 and categoricas:
+        limpias = [p.copy(deep=False) for p in limpias]
+        for col in categoricas:
+            union = sorted(set().union(*(p[col].cat.categories for p in limpias)))
+            for p in limpias: p[col] = p[col].cat.set_categories(union)
+    return pd.concat(limpias, ignore_index=True)
+
+
+def limpiar_datos(datos):
+    # Fecha válida + columnas de filtro. Se aplica por partición (archivo), nunca al histórico completo.
+    datos_base_limpia = datos.copy()
+    datos_base_limpia[COL_TEMP_DATETIME] = pd.to_datetime(datos_base_limpia[COL_FECHA_KEY], errors='coerce')
+    datos_base_limpia.dropna(subset=[COL_TEMP_DATETIME], inplace=True)
+
+    if COL_TECNICO_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_TECNICO] = normalizar_por_unicos(datos_base_limpia[COL_TECNICO_KEY], clean_tecnico)
+    if COL_CIUDAD_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_CIUDAD] = normalizar_por_unicos(datos_base_limpia[COL_CIUDAD_KEY], clean_ciudad)
+    # Todas las columnas _Filtro_* son categóricas (códigos + diccionario compartido)
+    if COL_ESTADO_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_ESTADO] = normalizar_por_unicos(datos_base_limpia[COL_ESTADO_KEY], clean_mayusculas)
+    if COL_TIPO_ORDEN_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_TIPO_ORDEN] = normalizar_por_unicos(datos_base_limpia[COL_TIPO_ORDEN_KEY], clean_mayusculas)
+    if COL_TECNOLOGIA_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_TECNOLOGIA] = normalizar_por_unicos(datos_base_limpia[COL_TECNOLOGIA_KEY], clean_mayusculas)
+    if COL_TIPO_MANUAL_KEY in datos_base_limpia.columns:
+        datos_base_limpia[COL_FILTRO_TIPO_MANUAL] = normalizar_por_unicos(datos_base_limpia[COL_TIPO_MANUAL_KEY], clean_tipo_manual)
+    datos_base_limpia[COL_FLAGS_TIPO] = calcular_flags_tipo(datos_base_limpia)
+    return datos_base_limpia
+
+
+def columnas_exportables(df):
+    # Las mismas que exportaba la base limpia original (A..J, _DATETIME_A y _Filtro_*): _FLAGS_TIPO_ solo sirve al cubo
+    return [c for c in df.columns if c != COL_FLAGS_TIPO]
+
+
+# --- FILTROS SOBRE CÓDIGOS ---
+def mascara_valores(serie, valores):
+    # Equivale a serie.astype(str).isin(valores), pero en categóricas compara códigos enteros
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return np.isin(serie.cat.codes.to_numpy(), codigos_valores(serie, valores))
+    return serie.astype(str).isin(valores).to_numpy()
+
+
+def codigos_valores(serie, valores):
+    # Códigos de categoría de `valores` (los que no existen se descartan)
+    codigos = serie.cat.categories.get_indexer(pd.Index(valores, dtype=object))
+    return codigos[codigos >= 0]
+
+
+# --- CUBO DE CONTEOS (OLAP) ---
+# Conteo de filas por combinación (día, 6 columnas _Filtro_*, máscara de tipo), materializado al cargar.
+# KPIs y gráficos de Rendimiento se resuelven filtrando y sumando celdas: el coste depende del número
+# de combinaciones distintas, no del número de órdenes.
+COL_DIA = '_DIA_'  # días desde 1970-01-01 (int)
+COL_CONTEO = '_N_'
+COL_FECHA_DIA = '_FECHA_DIA_'
+DIMENSIONES_CUBO = [COL_FILTRO_CIUDAD, COL_FILTRO_TECNICO, COL_FILTRO_ESTADO, COL_FILTRO_TIPO_ORDEN, COL_FILTRO_TECNOLOGIA, COL_FILTRO_TIPO_MANUAL]
+TOTALES_TIPO = {
+    'Total_Instalaciones': BIT_INSTALACION, 'Total_Visitas': BIT_VISITA, 'Total_Migracion': BIT_MIGRACION,
+    'Total_TareaManual': BIT_TAREA_MANUAL, 'Total_CambioDireccion': BIT_CAMBIO_DIRECCION, 'Total_MigraTec': BIT_MIGRATEC
+}
+
+
+def dia_ordinal(fecha):
+    return int(np.datetime64(fecha, 'D').astype(np.int64))
+
+
+def dias_de(df):
+    return df[COL_TEMP_DATETIME].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def fechas_de_dias(dias):
+    # Días (int) -> objetos datetime.date, igual que .dt.date
+    return pd.to_datetime(np.asarray(dias, dtype=np.int64), unit='D').date
+
+
+class CuboConteos:
+    def __init__(self, df):
+        n = len(df)
+        columnas = {COL_DIA: dias_de(df)}
+        categorias = {}
+        for col in DIMENSIONES_CUBO:
+            if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                columnas[col] = df[col].cat.codes.to_numpy()
+                categorias[col] = df[col].cat.categories
+        columnas[COL_FLAGS_TIPO] = df[COL_FLAGS_TIPO].to_numpy() if COL_FLAGS_TIPO in df.columns else np.zeros(n, dtype=np.uint8)
+        codigos = pd.DataFrame(columnas)
+        celdas = codigos.groupby(list(codigos.columns), sort=False).size().reset_index(name=COL_CONTEO)
+        for col, cats in categorias.items():
+            celdas[col] = pd.Categorical.from_codes(celdas[col].to_numpy(), categories=cats)
+        celdas[COL_CONTEO] = celdas[COL_CONTEO].astype(np.int64)
+        self.celdas = celdas
+        self.filas = n
+
+    def filtrar(self, fecha_desde, fecha_hasta, selecciones, estado_base=None):
+        # Celdas del rango [fecha_desde, fecha_hasta] (fechas, ambos incluidos) que cumplen las selecciones
+        # {col_filtro: [valores]} (lista vacía = sin filtro). Base de métricas: estado_base si se indica,
+        # si no SATISFACTORIA (bit precalculado).
+        celdas = self.celdas
+        dias = celdas[COL_DIA].to_numpy()
+        mascara = (dias >= dia_ordinal(fecha_desde)) & (dias <= dia_ordinal(fecha_hasta))
+        for col, valores in selecciones.items():
+            if valores and col in celdas.columns:
+                mascara &= np.isin(celdas[col].cat.codes.to_numpy(), codigos_valores(celdas[col], valores))
+        if estado_base is not None:
+            mascara &= np.isin(celdas[COL_FILTRO_ESTADO].cat.codes.to_numpy(), codigos_valores(celdas[COL_FILTRO_ESTADO], [estado_base]))
+        else:
+            mascara &= (celdas[COL_FLAGS_TIPO].to_numpy() & BIT_SATISFACTORIA) != 0
+        return celdas[mascara]
+
+
+# --- KERNEL DE AGREGACIÓN ---
+# Todas las vistas de comparación (ciudad, técnico, día, ciudad×técnico) se agregan igual: códigos
+# enteros de grupo (radix mixto de las dimensiones) + matriz celdas×tipos, sumadas en una sola pasada
+# de np.bincount. Sin copias del corte ni groupby de pandas.
+def matriz_tipos(celdas, total_tareas=False):
+    # Matriz (celdas × tipos en el orden de TOTALES_TIPO): conteo de la celda si tiene el bit del tipo, 0 si no
+    flags, n = celdas[COL_FLAGS_TIPO].to_numpy(), celdas[COL_CONTEO].to_numpy()
+    bits = np.array(list(TOTALES_TIPO.values()), dtype=flags.dtype)
+    matriz = ((flags[:, None] & bits) != 0) * n[:, None]
+    return np.column_stack([matriz, n]) if total_tareas else matriz
+
+
+def sumar_por_grupo(codigos, matriz, grupos):
+    # Suma por código de grupo (0..grupos-1) de cada columna de `matriz`: un único bincount sobre la matriz aplanada
+    k = matriz.shape[1]
+    indices = (codigos[:, None] * k + np.arange(k)).ravel()
+    return np.bincount(indices, weights=matriz.ravel(), minlength=grupos * k).reshape(grupos, k).astype(np.int64)
+
+
+# --- CUBETAS TEMPORALES ---
+# En rangos largos las series por día se agrupan por semana ISO o por mes para no pasar de unos
+# PUNTOS_MAX_SERIE puntos. La cubeta se calcula directamente sobre el día ordinal ya precalculado en el cubo.
+PUNTOS_MAX_SERIE = 60
+GRANULARIDADES = {'dia': 'Día', 'semana': 'Semana', 'mes': 'Mes'}
+
+
+def cubetas_de_dias(dias, granularidad):
+    # Día ordinal -> día ordinal del inicio de su cubeta (lunes de la semana ISO / día 1 del mes)
+    if granularidad == 'semana': return dias - (dias + 3) % 7  # el día 0 (1970-01-01) fue jueves
+    if granularidad == 'mes': return dias.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    return dias
+
+
+def elegir_granularidad(fecha_desde, fecha_hasta, max_puntos=PUNTOS_MAX_SERIE):
+    dias = dia_ordinal(fecha_hasta) - dia_ordinal(fecha_desde) + 1
+    if dias <= max_puntos: return 'dia'
+    if -(-dias // 7) <= max_puntos: return 'semana'
+    return 'mes'
+
+
+def totales_cubo(celdas):
+    # Total de tareas y total por tipo (nombres Total_*) de un corte del cubo
+    sumas = matriz_tipos(celdas, total_tareas=True).sum(axis=0)
+    return {nombre: int(v) for nombre, v in zip([*TOTALES_TIPO, 'Total_Tareas'], sumas)}
+
+
+def agregar_cubo(celdas, columnas, total_tareas=False, granularidad='dia', fecha_desde=None):
+    # Mismo esquema que el groupby(...).agg(Total_*=sum) sobre filas: una fila por grupo presente, ordenada.
+    # Con COL_DIA entre las columnas, granularidad agrupa por día/semana/mes (fecha de inicio de la cubeta);
+    # con fecha_desde, la primera cubeta se etiqueta con esa fecha si su inicio cae antes (semana/mes parcial).
+    if celdas.empty or any(c not in celdas.columns for c in columnas): return pd.DataFrame()
+    codigo = np.zeros(len(celdas), dtype=np.int64)
+    validas = np.ones(len(celdas), dtype=bool)
+    dimensiones = []  # (columna, origen del día o categorías, tamaño)
+    for col in columnas:
+        if col == COL_DIA:
+            valores = cubetas_de_dias(celdas[col].to_numpy().astype(np.int64), granularidad)
+            if fecha_desde is not None: valores = np.maximum(valores, dia_ordinal(fecha_desde))
+            origen = int(valores.min())
+            valores, tamano = valores - origen, int(valores.max()) - origen + 1
+        else:
+            origen = celdas[col].cat.categories
+            valores, tamano = celdas[col].cat.codes.to_numpy().astype(np.int64), max(len(origen), 1)
+        validas &= valores >= 0  # como groupby: sin grupos NaN
+        codigo = codigo * tamano + valores
+        dimensiones.append((col, origen, tamano))
+    presentes, grupo = np.unique(codigo[validas], return_inverse=True)
+    matriz = matriz_tipos(celdas, total_tareas)[validas]
+    sumas = sumar_por_grupo(grupo.ravel(), matriz, len(presentes))
+    resultado = {}
+    for col, origen, tamano in reversed(dimensiones):
+        presentes, valores = np.divmod(presentes, tamano)
+        if col == COL_DIA: resultado[COL_FECHA_DIA] = fechas_de_dias(valores + origen)
+        else: resultado[col] = pd.Categorical.from_codes(valores, categories=origen)
+    columnas_salida = [COL_FECHA_DIA if c == COL_DIA else c for c in columnas]
+    totales = [*TOTALES_TIPO, *(['Total_Tareas'] if total_tareas else [])]
+    return pd.DataFrame({**{c: resultado[c] for c in columnas_salida}, **{nombre: sumas[:, i] for i, nombre in enumerate(totales)}})
+
+
+# --- TOP-N CON "OTROS" ---
+# Con cientos de técnicos/ubicaciones los gráficos por categoría se vuelven ilegibles y lentos: se
+# conservan las n categorías de mayor volumen (selección parcial con argpartition, sin ordenar todo)
+# y el resto se suma en una única categoría "Otros". El volumen es una columna propia (total de tareas
+# distintas): la suma de los Total_* contaría dos veces las tareas con varios tipos y nunca las sin tipo.
+ETIQUETA_OTROS = 'Otros'
+
+
+def top_n_con_otros(df, col_etiqueta, columnas_valor, n, col_volumen):
+    # Las n filas de mayor col_volumen (una de columnas_valor) en su orden original + fila "Otros" al final
+    if n <= 0 or len(df) <= n + 1: return df
+    valores = df[columnas_valor].to_numpy()
+    top = np.sort(np.argpartition(-df[col_volumen].to_numpy(), n - 1)[:n])
+    resto = np.ones(len(df), dtype=bool)
+    resto[top] = False
+    cabeza = df.iloc[top]
+    cabeza = cabeza.assign(**{col_etiqueta: cabeza[col_etiqueta].astype(object)})  # categórica -> admite "Otros"
+    otros = pd.DataFrame({col_etiqueta: [ETIQUETA_OTROS], **{c: [valores[resto, i].sum()] for i, c in enumerate(columnas_valor)}})
+    return pd.concat([cabeza, otros], ignore_index=True)
+
+
+# --- ÍNDICE DE BITMAPS (FILTRO CRUZADO) ---
+# Un bitmap de filas (1 bit por fila, en palabras uint64) por cada valor de cada columna _Filtro_*.
+# Las opciones de cada filtro salen de AND entre filtros / OR entre valores seleccionados, más un
+# popcount por valor candidato: sin DataFrames intermedios ni unique() por widget.
+VALORES_POR_BLOQUE = 64  # valores por bloque al contar (acota la memoria temporal)
+
+
+def bitmap_de_mascara(mascara):
+    bytes_ = np.packbits(mascara, bitorder='little')
+    relleno = (-len(bytes_)) % 8
+    if relleno: bytes_ = np.concatenate([bytes_, np.zeros(relleno, dtype=np.uint8)])
+    return bytes_.view('<u8').astype(np.uint64)
+
+
+def opciones_validas(valores):
+    return sorted(v for v in valores if pd.notna(v) and str(v).strip() not in ('nan', 'none', ''))
+
+
+class IndiceBitmaps:
+    def __init__(self, df):
+        self.filas = len(df)
+        self.palabras = (self.filas + 63) // 64
+        self.categorias = {}
+        self.bitmaps = {}  # col -> matriz uint64 [valor, palabra]
+        posiciones = np.arange(self.filas, dtype=np.int64)
+        for col in DIMENSIONES_CUBO:
+            if col not in df.columns or not isinstance(df[col].dtype, pd.CategoricalDtype): continue
+            codigos = df[col].cat.codes.to_numpy().astype(np.int64)
+            validos = codigos >= 0
+            matriz = np.zeros((len(df[col].cat.categories), self.palabras), dtype=np.uint64)
+            bits = np.left_shift(np.uint64(1), (posiciones[validos] & 63).astype(np.uint64))
+            np.bitwise_or.at(matriz, (codigos[validos], posiciones[validos] >> 6), bits)
+            self.categorias[col] = df[col].cat.categories
+            self.bitmaps[col] = matriz
+
+    def bitmap_tramo(self, inicio, fin):
+        # Filas [inicio, fin): la base está ordenada por fecha, así que un rango de fechas es un tramo
+        mascara = np.zeros(self.filas, dtype=bool)
+        mascara[inicio:fin] = True
+        return bitmap_de_mascara(mascara)
+
+    def bitmap_valores(self, col, valores):
+        # OR de los bitmaps de los valores indicados (los que no existen no aportan filas)
+        codigos = self.categorias[col].get_indexer(pd.Index(valores, dtype=object))
+        codigos = codigos[codigos >= 0]
+        if not len(codigos): return np.zeros(self.palabras, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bitmaps[col][codigos], axis=0)
+
+    def conteos(self, col, bitmap):
+        # popcount(bitmap_valor & bitmap) para cada valor de col
+        matriz = self.bitmaps[col]
+        conteos = np.zeros(len(matriz), dtype=np.int64)
+        for i in range(0, len(matriz), VALORES_POR_BLOQUE):
+            conteos[i:i + VALORES_POR_BLOQUE] = np.bitwise_count(matriz[i:i + VALORES_POR_BLOQUE] & bitmap).sum(axis=1)
+        return conteos
+
+    def opciones_cruzadas(self, tramo, selecciones):
+        # {col: opciones}: para cada filtro, valores con filas en el tramo (inicio, fin) aplicando todos los
+        # filtros EXCEPTO el propio (selecciones: {col_filtro: [valores]}, lista vacía = sin filtro)
+        base = self.bitmap_tramo(*tramo)
+        por_filtro = {col: self.bitmap_valores(col, valores) for col, valores in selecciones.items() if valores and col in self.bitmaps}
+        opciones = {}
+        for col in selecciones:
+            if col not in self.bitmaps: opciones[col] = []; continue
+            bitmap = base.copy()
+            for otra, bitmap_otra in por_filtro.items():
+                if otra != col: bitmap &= bitmap_otra
+            opciones[col] = opciones_validas(self.categorias[col][self.conteos(col, bitmap) > 0].astype(str))
+        return opciones
+
+
+# --- ÍNDICE TEMPORAL ---
+# La base limpia se mantiene ordenada por fecha: un rango Desde/Hasta es un tramo contiguo de filas
+# que se resuelve con searchsorted sobre el índice de días, y se extrae con iloc (sin copia).
+def ordenar_por_fecha(df):
+    if df[COL_TEMP_DATETIME].is_monotonic_increasing: return df
+    return df.sort_values(by=COL_TEMP_DATETIME, kind='stable', ignore_index=True)
+
+
+class IndiceTemporal:
+    def __init__(self, df):
+        # df ya ordenado por COL_TEMP_DATETIME y sin fechas nulas
+        dias = dias_de(df)
+        self.filas = len(df)
+        self.fecha_min = df[COL_TEMP_DATETIME].iloc[0].normalize() if self.filas else None
+        self.fecha_max = df[COL_TEMP_DATETIME].iloc[-1].normalize() if self.filas else None
+        self.dia_min = int(dias[0]) if self.filas else 0
+        # inicio_dia[k] = primera fila con día >= dia_min + k (el último elemento es el total de filas)
+        self.inicio_dia = np.searchsorted(dias, np.arange(self.dia_min, int(dias[-1]) + 2 if self.filas else 1))
+
+    def posiciones(self, fecha_desde, fecha_hasta):
+        # Tramo [inicio, fin) de filas con fecha en [fecha_desde, fecha_hasta] (días completos)
+        ultimo = len(self.inicio_dia) - 1
+        desde = min(max(dia_ordinal(fecha_desde) - self.dia_min, 0), ultimo)
+        hasta = min(max(dia_ordinal(fecha_hasta) + 1 - self.dia_min, 0), ultimo)
+        return int(self.inicio_dia[desde]), max(int(self.inicio_dia[hasta]), int(self.inicio_dia[desde]))
+
+
+_VERSIONES = itertools.count(1)
+
+
+def rango_orden(serie):
+    # Rango entero denso que ordena igual que sort_values (nulos al final)
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Las categorías de los CSV van en orden de aparición: se ordena la tabla de categorías, no las filas
+        orden = pd.factorize(serie.cat.categories.astype(str), sort=True)[0].astype(np.int64)
+        rango = np.append(orden, -1)[serie.cat.codes.to_numpy()]  # código -1 (nulo) -> último elemento
+    else:
+        valores = serie
+        if not (pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_datetime64_any_dtype(serie.dtype)):
+            valores = serie.where(serie.isna(), serie.astype(str))
+        rango = pd.factorize(valores, sort=True)[0].astype(np.int64)
+    if len(rango): rango[rango < 0] = rango.max() + 1
+    return rango
+
+
+def buscar_texto(df, posiciones, columnas, texto):
+    # Máscara (sobre `posiciones`) de filas donde alguna de `columnas` contiene `texto` (sin distinguir
+    # mayúsculas). En categóricas se evalúa una vez por categoría y se compara por códigos.
+    mascara = np.zeros(len(posiciones), dtype=bool)
+    for col in columnas:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            coincide = pd.Series(serie.cat.categories.astype(str)).str.contains(texto, case=False, regex=False).to_numpy()
+            mascara |= np.isin(serie.cat.codes.to_numpy()[posiciones], np.flatnonzero(coincide))
+        else:
+            mascara |= serie.iloc[posiciones].astype(str).str.contains(texto, case=False, regex=False, na=False).to_numpy()
+    return mascara
+
+
+class BaseIndexada:
+    # Base limpia ordenada por fecha + estructuras precalculadas sobre ella. Compartida: no modificar.
+    # `version` identifica el contenido (clave de memo.MEMO para los resultados derivados).
+    # El índice de filas es 0..n-1: etiqueta de fila = posición en la base.
+    def __init__(self, df):
+        self.version = next(_VERSIONES)
+        self.datos = ordenar_por_fecha(df)
+        if not self.datos.index.equals(pd.RangeIndex(len(self.datos))): self.datos = self.datos.reset_index(drop=True)
+        self.temporal = IndiceTemporal(self.datos)
+        self.cubo = CuboConteos(self.datos)
+        self.indice = IndiceBitmaps(self.datos)
+        self._permutaciones = {}
+        self._lock = threading.Lock()
+
+    # --- Selección de filas por posiciones (sin copiar la base) ---
+    def seleccionar(self, tramo, selecciones):
+        # Posiciones de las filas del tramo [inicio, fin) que cumplen {col_filtro: [valores]} (vacío = sin filtro)
+        inicio, fin = tramo
+        mascara = np.ones(fin - inicio, dtype=bool)
+        for col, valores in selecciones.items():
+            if valores and col in self.datos.columns: mascara &= mascara_valores(self.datos[col].iloc[inicio:fin], valores)
+        return inicio + np.flatnonzero(mascara)
+
+    def seleccionar_base_metricas(self, posiciones, estado_base=None):
+        # Subconjunto de `posiciones` con ESTADO == estado_base, o SATISFACTORIA (bit precalculado) si no se indica
+        if estado_base is not None:
+            serie = self.datos[COL_FILTRO_ESTADO]
+            mascara = np.isin(serie.cat.codes.to_numpy()[posiciones], codigos_valores(serie, [estado_base]))
+        else:
+            mascara = (self.datos[COL_FLAGS_TIPO].to_numpy()[posiciones] & BIT_SATISFACTORIA) != 0
+        return posiciones[mascara]
+
+    def columna(self, col, posiciones):
+        # Solo la columna pedida, en las filas seleccionadas
+        return self.datos[col].iloc[posiciones]
+
+    def permutacion(self, columna, ascendente=True):
+        # Orden estable de TODAS las filas de la base por `columna` (se calcula una vez por columna y sentido)
+        clave = (columna, ascendente)
+        with self._lock: permutacion = self._permutaciones.get(clave)
+        if permutacion is None:
+            rango = rango_orden(self.datos[columna])
+            # Descendente: se invierte solo el rango de los no nulos; los nulos siguen al final (como sort_values)
+            if not ascendente: rango = np.where(self.datos[columna].isna().to_numpy(), 1, -rango)
+            permutacion = np.argsort(rango, kind='stable')
+            with self._lock: self._permutaciones[clave] = permutacion
+        return permutacion
+
+    def ordenar_seleccion(self, posiciones, columna, ascendente=True):
+        # Posiciones seleccionadas en el orden de `columna`, filtrando la permutación precalculada (sin sort)
+        if columna == COL_TEMP_DATETIME and ascendente: return np.sort(posiciones)  # la base ya está ordenada por fecha
+        seleccion = np.zeros(len(self.datos), dtype=bool)
+        seleccion[posiciones] = True
+        permutacion = self.permutacion(columna, ascendente)
+        return permutacion[seleccion[permutacion]]
+
+
+# --- DATASET PARTICIONADO POR ARCHIVO FUENTE ---
+# Cada archivo es una partición ya limpia, repartida a su vez por mes. Subir un archivo solo limpia sus
+# filas; borrarlo solo descarta su partición. Al guardar el histórico (ver HistoricoMensual) solo se
+# re-arman y reescriben los meses que tocan los archivos nuevos, modificados o borrados desde el último
+# guardado; el resto de meses conserva su archivo. Tras reiniciar el proceso el dataset arranca vacío:
+# el primer cambio vuelve a limpiar todos los archivos (desde sus copias Parquet) y a escribir todos los meses.
+class DatasetParticionado:
+    def __init__(self):
+        self._particiones = {}    # ruta -> (df_origen, {mes: tramo limpio del archivo})
+        self._orden = []          # rutas en el orden de la última sincronización
+        self._pendientes = set()  # meses modificados desde el último histórico guardado
+        self._historico = None    # último HistoricoMensual guardado desde este dataset
+        self._lock = threading.Lock()
+
+    def sincronizar(self, lecturas):
+        # lecturas: [(ruta, df_origen)] en el orden deseado. df_origen viene de la caché de ingesta,
+        # así que mientras el archivo no cambie es el mismo objeto y su partición se reutiliza.
+        with self._lock:
+            rutas = [ruta for ruta, _ in lecturas]
+            for ruta in [r for r in self._particiones if r not in rutas]:
+                self._pendientes.update(self._particiones.pop(ruta)[1])
+            for ruta, df_origen in lecturas:
+                actual = self._particiones.get(ruta)
+                if actual is None or actual[0] is not df_origen:
+                    meses = dict(particionar_por_mes(limpiar_datos(df_origen)))
+                    if actual is not None: self._pendientes.update(actual[1])
+                    self._pendientes.update(meses)
+                    self._particiones[ruta] = (df_origen, meses)
+            # Un cambio de orden entre archivos que siguen presentes cambia el orden de las filas con la misma fecha
+            if [r for r in rutas if r in self._orden] != [r for r in self._orden if r in rutas]:
+                self._pendientes.update(m for _, meses in self._particiones.values() for m in meses)
+            self._orden = rutas
+
+    def mes(self, mes):
+        # Filas limpias del mes (de todos los archivos, en su orden) ordenadas por fecha
+        tramos = [self._particiones[ruta][1][mes] for ruta in self._orden if mes in self._particiones[ruta][1]]
+        return ordenar_por_fecha(concatenar_particiones(tramos))
+
+    def guardar(self, carpeta, firma, filas_origen=0, avisos=()):
+        # Escribe el histórico mensual reescribiendo solo los meses pendientes
+        with self._lock:
+            meses = sorted({m for _, por_mes in self._particiones.values() for m in por_mes})
+            previas = self._historico.particiones if self._historico is not None and self._historico.carpeta == carpeta else {}
+            reutilizadas = {m: previas[m] for m in meses if m in previas and m not in self._pendientes}
+            nuevas = [(m, self.mes(m)) for m in meses if m not in reutilizadas]
+            self._historico = HistoricoMensual.escribir(carpeta, nuevas, firma, filas_origen, avisos, reutilizadas)
+            self._pendientes.clear()
+            return self._historico
+
+
+DATASET = DatasetParticionado()
+
+
+# --- HISTÓRICO PARTICIONADO POR MES ---
+# La base limpia consolidada se guarda en una partición Parquet por mes, con un manifiesto JSON
+# (fecha mín/máx y nº de filas por partición + firma de las fuentes que la generaron). El dashboard
+# solo carga e indexa las particiones que se solapan con la ventana Desde/Hasta, y los límites de los
+# selectores de fecha salen del manifiesto: el arranque en frío y la memoria dependen de la ventana
+# vista, no del histórico total. Si la firma del manifiesto coincide con la de las fuentes, ni siquiera
+# se leen los archivos fuente. Sin carpeta (datos de prueba / maestro) las particiones viven en memoria.
+# Los archivos se nombran por el hash de su contenido: al publicar un histórico nuevo, los meses que no
+# cambiaron conservan su archivo, y el nombre nunca colisiona entre procesos ni entre versiones.
+FORMATO_HISTORICO = 2
+MANIFIESTO_HISTORICO = 'manifiesto.json'
+HISTORICO_MAX_BASES = int(os.getenv("HISTORICO_MAX_BASES", 4))
+# Meses (de calendario, hasta el último con datos) que abarca la ventana por defecto de cada sesión
+VENTANA_INICIAL_MESES = int(os.getenv("VENTANA_INICIAL_MESES", 3))
+
+
+def particionar_por_mes(df):
+    # [(mes 'AAAA-MM', tramo del df ordenado por fecha)]; sin filas (ninguna fecha válida) -> []
+    if df is None or df.empty: return []
+    df = ordenar_por_fecha(df)
+    meses = df[COL_TEMP_DATETIME].to_numpy().astype('datetime64[M]')
+    cortes = [0, *(np.flatnonzero(meses[1:] != meses[:-1]) + 1).tolist(), len(df)]
+    return [(str(meses[inicio]), df.iloc[inicio:fin]) for inicio, fin in zip(cortes[:-1], cortes[1:])]
+
+
+def huella_particion(p):
+    # Hash del contenido de una partición (valores por fila + nombres y tipos de columna)
+    h = hashlib.blake2b(digest_size=12)
+    h.update(repr([(str(c), str(t)) for c, t in p.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(p, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class HistoricoMensual:
+    _vivos = weakref.WeakSet()  # instancias en uso: sus archivos no se borran al publicar uno nuevo
+
+    def __init__(self, carpeta, manifiesto, memoria=None):
+        self.version = next(_VERSIONES)
+        self.carpeta = carpeta
+        self.particiones = manifiesto['particiones']  # mes -> {'fecha_min', 'fecha_max', 'filas', 'archivo'}
+        self.filas_origen = manifiesto['filas_origen']
+        self.avisos = [tuple(a) for a in manifiesto['avisos']]
+        self._memoria = memoria                        # mes -> df (solo sin carpeta)
+        self._bases = OrderedDict()                    # meses -> BaseIndexada (LRU)
+        self._lock = threading.Lock()
+        HistoricoMensual._vivos.add(self)
+
+    @staticmethod
+    def manifiesto_de(particiones, firma, filas_origen, avisos):
+        meta = {mes: {'fecha_min': str(p[COL_TEMP_DATETIME].iloc[0]), 'fecha_max': str(p[COL_TEMP_DATETIME].iloc[-1]),
+                      'filas': len(p), 'archivo': None} for mes, p in particiones}
+        return {'formato': FORMATO_HISTORICO, 'firma': json.loads(json.dumps(firma)), 'filas_origen': filas_origen, 'avisos': [list(a) for a in avisos], 'particiones': meta}
+
+    @classmethod
+    def en_memoria(cls, df, filas_origen=0, avisos=()):
+        particiones = particionar_por_mes(df)
+        return cls(None, cls.manifiesto_de(particiones, None, filas_origen, avisos), dict(particiones))
+
+    @classmethod
+    def escribir(cls, carpeta, particiones, firma, filas_origen=0, avisos=(), reutilizadas=None):
+        # particiones: [(mes, df del mes ordenado por fecha)] a escribir; reutilizadas: {mes: entrada del
+        # manifiesto anterior} de los meses sin cambios. firma: identifica las fuentes (JSON; se compara en abrir)
+        os.makedirs(carpeta, exist_ok=True)
+        manifiesto = cls.manifiesto_de(particiones, firma, filas_origen, avisos)
+        manifiesto['particiones'] = dict(sorted({**manifiesto['particiones'], **(reutilizadas or {})}.items()))
+        for mes, p in particiones:
+            # Sin categorías ajenas al mes: el archivo depende solo de sus filas (ver concatenar_particiones)
+            categoricas = [c for c in p.columns if isinstance(p[c].dtype, pd.CategoricalDtype)]
+            if categoricas: p = p.assign(**{c: p[c].cat.remove_unused_categories() for c in categoricas})
+            archivo = f"{mes}.{huella_particion(p)}.parquet"
+            destino = os.path.join(carpeta, archivo)
+            # Mismo contenido -> mismo nombre: un mes sin cambios reutiliza su archivo sin reescribirlo
+            if not os.path.exists(destino):
+                temporal = f"{destino}.{os.getpid()}.tmp"
+                p.to_parquet(temporal, index=False)
+                os.replace(temporal, destino)
+            manifiesto['particiones'][mes]['archivo'] = archivo
+        temporal = os.path.join(carpeta, f"{MANIFIESTO_HISTORICO}.{os.getpid()}.tmp")
+        with open(temporal, 'w', encoding='utf-8') as fh: json.dump(manifiesto, fh)
+        os.replace(temporal, os.path.join(carpeta, MANIFIESTO_HISTORICO))
+        nuevo = cls(carpeta, manifiesto)
+        cls.podar(carpeta)
+        return nuevo
+
+    @classmethod
+    def abrir(cls, carpeta, firma):
+        # Devuelve el histórico guardado si corresponde a `firma`, o None
+        try:
+            with open(os.path.join(carpeta, MANIFIESTO_HISTORICO), encoding='utf-8') as fh: manifiesto = json.load(fh)
+        except (OSError, ValueError): return None
+        if manifiesto.get('formato') != FORMATO_HISTORICO or manifiesto.get('firma') != json.loads(json.dumps(firma)): return None
+        if not all(os.path.exists(os.path.join(carpeta, p['archivo'])) for p in manifiesto['particiones'].values()): return None
+        return cls(carpeta, manifiesto)
+
+    @classmethod
+    def podar(cls, carpeta):
+        # Borra las particiones que ningún histórico vivo referencia (las versiones retiradas aún en uso se conservan)
+        en_uso = {p['archivo'] for h in list(cls._vivos) if h.carpeta == carpeta for p in h.particiones.values()}
+        for archivo in os.listdir(carpeta):
+            if archivo.endswith('.parquet') and archivo not in en_uso:
+                try: os.remove(os.path.join(carpeta, archivo))
+                except OSError: pass
+
+    @property
+    def filas(self): return sum(p['filas'] for p in self.particiones.values())
+
+    @property
+    def fecha_min(self):
+        # Mín/máx globales para los selectores de fecha, sin cargar ninguna partición
+        return min(pd.Timestamp(p['fecha_min']) for p in self.particiones.values()).normalize() if self.particiones else None
+
+    @property
+    def fecha_max(self):
+        return max(pd.Timestamp(p['fecha_max']) for p in self.particiones.values()).normalize() if self.particiones else None
+
+    @property
+    def fecha_inicial(self):
+        # "Desde" por defecto: inicio de los últimos VENTANA_INICIAL_MESES meses, no el mínimo global. Así la
+        # primera ejecución de cada sesión solo carga e indexa esos meses, no todo el histórico.
+        if not self.particiones: return None
+        inicio = (self.fecha_max.to_period('M') - (VENTANA_INICIAL_MESES - 1)).start_time
+        return max(inicio, self.fecha_min)
+
+    def meses_en(self, fecha_desde, fecha_hasta):
+        # Particiones que se solapan con [fecha_desde, fecha_hasta] (días completos). Si la ventana cae en un
+        # hueco se carga igualmente la partición siguiente (o la última): el tramo resultante estará vacío.
+        desde, hasta = pd.Timestamp(fecha_desde).normalize(), pd.Timestamp(fecha_hasta).normalize()
+        meses = sorted(self.particiones)
+        if not meses: return ()
+        solapados = [m for m in meses if pd.Timestamp(self.particiones[m]['fecha_min']).normalize() <= hasta
+                     and pd.Timestamp(self.particiones[m]['fecha_max']).normalize() >= desde]
+        if solapados: return tuple(solapados)
+        return (next((m for m in meses if pd.Timestamp(self.particiones[m]['fecha_min']) > hasta), meses[-1]),)
+
+    def leer(self, mes):
+        if self._memoria is not None: return self._memoria[mes]
+        df = pd.read_parquet(os.path.join(self.carpeta, self.particiones[mes]['archivo']))
+        # pyarrow devuelve None en los nulos de texto; se unifica con NaN como en la carga original
+        for col in df.columns:
+            if df[col].dtype == object: df[col] = df[col].where(df[col].notna(), np.nan)
+        return df
+
+    def base(self, fecha_desde, fecha_hasta):
+        # BaseIndexada de las particiones de la ventana; las últimas HISTORICO_MAX_BASES se reutilizan
+        meses = self.meses_en(fecha_desde, fecha_hasta)
+        with self._lock:
+            base = self._bases.get(meses)
+            if base is not None:
+                self._bases.move_to_end(meses)
+                return base
+            base = BaseIndexada(concatenar_particiones([self.leer(m) for m in meses]))
+            self._bases[meses] = base
+            while len(self._bases) > HISTORICO_MAX_BASES: self._bases.popitem(last=False)
+            return base
+
+
+# --- SNAPSHOT COMPARTIDO ENTRE SESIONES ---
+# Un único snapshot inmutable por proceso (histórico mensual + datos de la carga) que todas las sesiones
+# leen. Se identifica por la firma de los archivos fuente (ruta, tamaño, mtime): si no cambió, las
+# sesiones lo reutilizan sin tocar nada; si cambió, UNA sola sesión lo reconstruye (las demás esperan
+# y reutilizan el resultado) y se publica con una única asignación (swap atómico). Las versiones
+# retiradas se liberan por conteo de referencias cuando ninguna ejecución en curso las usa.
+class Snapshot:
+    def __init__(self, firma, historico, filas_origen, avisos):
+        self.firma = firma
+        self.historico = historico        # HistoricoMensual o None
+        self.filas_origen = filas_origen
+        self.avisos = avisos              # [(nivel, mensaje)] generados al construir, se muestran en cada sesión
+
+
+class SnapshotCompartido:
+    def __init__(self):
+        self._actual = None
+        self._retiradas = weakref.WeakValueDictionary()  # versión -> HistoricoMensual retirado aún referenciado
+        self._lock_carga = threading.Lock()
+
+    @property
+    def actual(self): return self._actual
+
+    def obtener(self, firma, construir, esperar_cambios=True):
+        # construir() -> (historico, filas_origen, avisos); solo se llama si la firma cambió.
+        # Con esperar_cambios=False (hay un trabajador de ingesta en segundo plano) se devuelve el snapshot
+        # publicado aunque esté desactualizado: solo la primera carga bloquea la petición.
+        actual = self._actual
+        if actual is not None and (actual.firma == firma or not esperar_cambios): return actual
+        return self.reconstruir(firma, construir)
+
+    def reconstruir(self, firma, construir):
+        with self._lock_carga:
+            actual = self._actual
+            if actual is not None and actual.firma == firma: return actual
+            nuevo = Snapshot(firma, *construir())
+            self.publicar(nuevo)
+            return nuevo
+
+    def publicar(self, nuevo):
+        anterior, self._actual = self._actual, nuevo
+        if anterior is not None and anterior.historico is not None and anterior.historico is not nuevo.historico:
+            self._retiradas[anterior.historico.version] = anterior.historico
+
+    def versiones_retenidas(self):
+        # Versiones anteriores que alguna sesión sigue usando (aún no liberadas)
+        return sorted(self._retiradas.keys())
+
+
+SNAPSHOT = SnapshotCompartido()
+
+
+# --- TRABAJADOR DE INGESTA EN SEGUNDO PLANO ---
+# Un hilo por proceso vigila los archivos fuente (por firma, cada INGESTA_INTERVALO_S segundos o en cuanto
+# se le avisa) y hace lectura + limpieza + indexado fuera de las peticiones. Mientras trabaja, las sesiones
+# siguen leyendo el snapshot publicado (doble buffer); al terminar, el nuevo se publica con un swap atómico.
+INGESTA_INTERVALO_S = float(os.getenv("INGESTA_INTERVALO_S", 2))
+
+
+def cambios_fuentes(anterior, nueva):
+    # Firma = (((ruta, tamaño, mtime), ...), mapeo). Devuelve los archivos nuevos/modificados y eliminados.
+    previos = {e[0]: e for e in anterior[0]} if anterior is not None else {}
+    actuales = {e[0]: e for e in nueva[0]}
+    cola = [os.path.basename(r) for r, e in actuales.items() if previos.get(r) != e]
+    return cola + [f"{os.path.basename(r)} (eliminado)" for r in previos if r not in actuales]
+
+
+class TrabajadorIngesta:
+    def __init__(self, snapshot, intervalo):
+        self.snapshot = snapshot
+        self.intervalo = intervalo
+        self._hilo = None
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+        self._estado = {'fase': 'inactivo', 'detalle': '', 'hechos': 0, 'total': 0, 'cola': [], 'error': None, 'publicado': None, 'duracion': None}
+
+    @property
+    def activo(self): return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self, firmar, construir):
+        # firmar() -> firma actual de las fuentes; construir(progreso) -> (historico, filas_origen, avisos),
+        # con progreso(detalle, hechos, total). Idempotente: se llama en cada rerun.
+        with self._lock:
+            if self.activo: return
+            self._hilo = threading.Thread(target=self._bucle, args=(firmar, construir), name='ingesta', daemon=True)
+            self._hilo.start()
+
+    def avisar(self): self._despertar.set()
+
+    def estado(self):
+        # 'pendiente': avisado (archivos subidos/borrados) pero aún sin empezar a procesar
+        with self._lock: return dict(self._estado, cola=list(self._estado['cola']), pendiente=self.activo and self._despertar.is_set())
+
+    def ocupado(self):
+        estado = self.estado()
+        return estado['fase'] == 'procesando' or estado['pendiente']
+
+    def _actualizar(self, **cambios):
+        with self._lock: self._estado.update(cambios)
+
+    def _progreso(self, detalle, hechos=0, total=0): self._actualizar(detalle=detalle, hechos=hechos, total=total)
+
+    def _bucle(self, firmar, construir):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                firma = firmar()
+                actual = self.snapshot.actual
+                if actual is not None and actual.firma == firma: continue
+                inicio = time.monotonic()
+                self._actualizar(fase='procesando', detalle='', hechos=0, total=0, error=None,
+                                 cola=cambios_fuentes(actual.firma if actual is not None else None, firma))
+                self.snapshot.reconstruir(firma, lambda: construir(self._progreso))
+                self._actualizar(fase='inactivo', detalle='', cola=[], publicado=datetime.now(), duracion=time.monotonic() - inicio)
+            except Exception as e: self._actualizar(fase='error', detalle='', error=str(e))
+
+
+TRABAJADOR = TrabajadorIngesta(SNAPSHOT, INGESTA_INTERVALO_S)
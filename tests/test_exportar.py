@@ -0,0 +1,32 @@
+import io
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import exportar
+import modelo
+
+COLUMNAS_EXPORT = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', '_DATETIME_A', '_Filtro_Tecnico_', '_Filtro_Ubicacion_',
+                   '_Filtro_Estado_', '_Filtro_TipoOrden_', '_Filtro_Tecnologia_', '_Filtro_TipoManual_']
+LECTORES = {
+    'xlsx': lambda contenido: pd.read_excel(io.BytesIO(contenido)),
+    'csv': lambda contenido: pd.read_csv(io.BytesIO(contenido), encoding='utf-8-sig'),
+    'parquet': lambda contenido: pd.read_parquet(io.BytesIO(contenido)),
+}
+
+
+@pytest.mark.parametrize('formato', list(exportar.FORMATOS_EXPORTACION))
+def test_columnas_exportadas(formato):
+    # Mismas columnas (y orden) que el export de la base limpia original, en los tres formatos
+    datos = modelo.limpiar_datos(pd.DataFrame({
+        'A': pd.date_range('2025-01-01', periods=3, freq='D'), 'B': ['Quito, Norte', None, 'Loja'], 'C': ['T|Ana', 'T|Luis', None],
+        'D': ['1', '2', '3'], 'E': ['c1', 'c2', 'c3'], 'F': ['GPON', None, 'HFC'], 'G': ['9', '8', '7'],
+        'H': ['FINALIZADA SATISFACTORIA', 'PENDIENTE', None], 'I': ['INSTALACION', 'MIGRATEC', None], 'J': [None, 'REVISION', None],
+    }))
+    columnas = modelo.columnas_exportables(datos)
+    assert columnas == COLUMNAS_EXPORT
+    contenido, extension, _ = exportar.exportar(datos[columnas], formato)
+    leido = LECTORES[extension](contenido)
+    assert list(leido.columns) == COLUMNAS_EXPORT and len(leido) == 3
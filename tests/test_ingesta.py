@@ -0,0 +1,52 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ingesta
+
+MAPEO = {'FECHA': 'A', 'UBICACIÓN': 'B', 'TÉCNICO': 'C', 'CONTRATO': 'D'}
+
+
+def test_columnas_mapeadas_no_contiguas_xlsx(tmp_path):
+    # Columnas no mapeadas antes, entre y después de las mapeadas (como los exports reales de 40+ columnas)
+    ruta = str(tmp_path / 'export.xlsx')
+    pd.DataFrame({
+        'ID INTERNO': [1, 2], 'Fecha': pd.to_datetime(['2025-01-02', '2025-01-03']), 'Extra': ['x', 'y'],
+        'Ubicación': ['Quito', 'Cali'], 'Observación': ['a', 'b'], 'Técnico': ['T|Ana', 'T|Luis'], 'Contrato': [1001, 1002], 'Final': [0, 0],
+    }).to_excel(ruta, index=False)
+    df, encontradas = ingesta.leer_archivo(ruta, MAPEO)[:2]
+    assert encontradas == 4
+    assert list(df.columns) == ['A', 'B', 'C', 'D']
+    assert df['B'].tolist() == ['Quito', 'Cali']
+    assert df['C'].tolist() == ['T|Ana', 'T|Luis']
+    assert df['D'].tolist() == ['1001', '1002']
+    assert pd.api.types.is_datetime64_any_dtype(df['A'])
+
+
+def test_columnas_mapeadas_no_contiguas_csv(tmp_path):
+    ruta = str(tmp_path / 'export.csv')
+    with open(ruta, 'w', encoding='latin1') as fh:
+        fh.write('ID INTERNO,Fecha,Extra,Ubicación,Técnico,Contrato,Final\n1,2025-01-02,x,Quito,T|Ana,1001,0\n')
+    df, encontradas = ingesta.leer_archivo(ruta, MAPEO)[:2]
+    assert encontradas == 4
+    assert df.iloc[0].tolist() == ['2025-01-02', 'Quito', 'T|Ana', '1001']
+
+
+def test_archivo_sin_columnas_mapeables(tmp_path):
+    ruta = str(tmp_path / 'otro.xlsx')
+    pd.DataFrame({'foo': [1], 'bar': [2]}).to_excel(ruta, index=False)
+    assert ingesta.leer_archivo(ruta, MAPEO)[:2] == (None, 0)
+
+
+def test_csv_por_bloques_llega_como_categorica(tmp_path, monkeypatch):
+    # Bloques pequeños: cada uno trae su propio diccionario y se unen sin pasar por object
+    ruta = str(tmp_path / 'grande.csv')
+    filas = [f'2025-01-{1 + i % 28:02d},{["Quito", "Cali", "", "Loja"][i % 4]},T|{i % 7},{1000 + i}' for i in range(3000)]
+    with open(ruta, 'w', encoding='utf-8') as fh: fh.write('Fecha,Ubicación,Técnico,Contrato\n' + '\n'.join(filas) + '\n')
+    monkeypatch.setattr(ingesta, 'BLOQUE_CSV', 4096)
+    df = ingesta.leer_archivo(ruta, MAPEO)[0]
+    esperado = pd.read_csv(ruta, dtype=str)
+    assert all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in df.columns)
+    for col, original in zip(df.columns, esperado.columns):
+        assert df[col].astype(object).where(df[col].notna(), None).tolist() == esperado[original].where(esperado[original].notna(), None).tolist()
@@ -0,0 +1,41 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import memo
+
+
+def test_expulsa_por_numero_de_entradas():
+    lru = memo.MemoLRU(max_entradas=2, max_bytes=10 ** 9)
+    calculos = []
+    calcular = lambda clave: lambda: calculos.append(clave) or clave
+    for clave in ('a', 'b', 'a', 'c'): lru.obtener(clave, calcular(clave))  # 'a' se usa antes que 'b'
+    assert calculos == ['a', 'b', 'c']
+    lru.obtener('a', calcular('a')); lru.obtener('b', calcular('b'))
+    assert calculos == ['a', 'b', 'c', 'b']  # 'b' era la menos usada y salió al entrar 'c'
+
+
+def test_expulsa_por_bytes():
+    bloque = lambda: np.zeros(1000, dtype=np.int64)  # 8000 bytes
+    lru = memo.MemoLRU(max_entradas=100, max_bytes=20000)
+    for clave in range(3): lru.obtener(clave, bloque)
+    assert list(lru._entradas) == [1, 2] and lru._bytes == 16000
+    # Un valor mayor que todo el presupuesto se devuelve sin guardarse ni expulsar nada
+    grande = lru.obtener('grande', lambda: np.zeros(5000, dtype=np.int64))
+    assert len(grande) == 5000 and list(lru._entradas) == [1, 2]
+
+
+def test_tamano_cuenta_el_texto_de_las_columnas_object():
+    texto = pd.DataFrame({'t': ['x' * 200] * 1000})
+    assert memo.tamano_aproximado(texto) > 200 * 1000
+    categorica = texto.astype('category')
+    assert memo.tamano_aproximado(categorica) < 10000
+
+
+def test_canonica_no_depende_del_orden_ni_del_tipo():
+    assert memo.canonica(['b', 'a']) == memo.canonica(['a', 'b']) == ('a', 'b')
+    assert memo.canonica(np.array(['b', 'a'])) == memo.canonica(pd.Series(['a', 'b']))
+    assert memo.canonica([]) == ()
+    assert hash(memo.canonica(['a', 1])) == hash(memo.canonica([1, 'a']))
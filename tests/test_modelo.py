@@ -0,0 +1,210 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import modelo
+
+TECNICOS = ['T|Ana Pérez', 'T|Luis Mora', 'SUP. Carla Ruiz', None]
+CIUDADES = ['Quito, Norte', 'Guayaquil', ' Ambato ', None]
+ESTADOS = ['FINALIZADA SATISFACTORIA', 'FINALIZADA INSATISFACTORIA', 'PENDIENTE', None]
+TIPOS = ['INSTALACION', 'VISITA TECNICA', 'MIGRACIÓN', 'TAREA MANUAL', 'CAMBIO DE DIRECCIÓN', 'MIGRATEC',
+         'INSTALACION MIGRATEC', 'VISITA TECNICA / MIGRACION', 'OTRO', None]
+
+
+def crudo(n, inicio='2025-01-01', semilla=0, frecuencia='7h'):
+    # Filas como las entrega la ingesta (columnas A..J como texto); incluye nulos y tipos con varios bits
+    azar = np.random.default_rng(semilla)
+    elegir = lambda valores: [valores[i] for i in azar.integers(0, len(valores), n)]
+    return pd.DataFrame({
+        'A': pd.date_range(inicio, periods=n, freq=frecuencia), 'B': elegir(CIUDADES), 'C': elegir(TECNICOS),
+        'D': [str(1000 + i) for i in range(n)], 'E': elegir(['cli 1', 'cli 2']), 'F': elegir(['GPON', 'HFC', None]),
+        'G': [str(9000 + i) for i in range(n)], 'H': elegir(ESTADOS), 'I': elegir(TIPOS), 'J': elegir(['INSTALACION', 'REVISION', None]),
+    })
+
+
+def test_guardar_reescribe_solo_los_meses_tocados(tmp_path, monkeypatch):
+    carpeta = str(tmp_path / 'historico')
+    dataset = modelo.DatasetParticionado()
+    enero_marzo, abril = crudo(240, '2025-01-01', 1, '8h'), crudo(30, '2025-04-02', 2)
+    dataset.sincronizar([('a.csv', enero_marzo), ('b.csv', abril)])
+    primero = dataset.guardar(carpeta, {'v': 1})
+    assert sorted(primero.particiones) == ['2025-01', '2025-02', '2025-03', '2025-04']
+
+    escritos = []
+    huella = modelo.huella_particion
+    monkeypatch.setattr(modelo, 'huella_particion', lambda p: escritos.append(len(p)) or huella(p))
+    # Solo cambia b.csv (abril + una fila de marzo): enero y febrero no se vuelven a armar ni a hashear
+    abril_nuevo = pd.concat([crudo(1, '2025-03-30', 3), crudo(35, '2025-04-02', 2)], ignore_index=True)
+    dataset.sincronizar([('a.csv', enero_marzo), ('b.csv', abril_nuevo)])
+    segundo = dataset.guardar(carpeta, {'v': 2})
+    assert len(escritos) == 2
+    for mes in ('2025-01', '2025-02'): assert segundo.particiones[mes] == primero.particiones[mes]
+    assert segundo.particiones['2025-04']['filas'] == 35
+
+    # El resultado es el mismo que guardar todo desde cero
+    completo = modelo.concatenar_particiones([modelo.limpiar_datos(enero_marzo), modelo.limpiar_datos(abril_nuevo)])
+    esperado = modelo.HistoricoMensual.escribir(str(tmp_path / 'desde_cero'), modelo.particionar_por_mes(completo), None)
+    assert {m: p['archivo'] for m, p in segundo.particiones.items()} == {m: p['archivo'] for m, p in esperado.particiones.items()}
+
+    # Borrar un archivo reescribe solo sus meses
+    escritos.clear()
+    dataset.sincronizar([('a.csv', enero_marzo)])
+    tercero = dataset.guardar(carpeta, {'v': 3})
+    assert len(escritos) == 1 and sorted(tercero.particiones) == ['2025-01', '2025-02', '2025-03']
+    assert set(os.listdir(carpeta)) >= {p['archivo'] for p in tercero.particiones.values()}
+
+
+def test_ventana_inicial_son_los_ultimos_meses():
+    historico = modelo.HistoricoMensual.en_memoria(modelo.limpiar_datos(crudo(500, '2025-01-10', frecuencia='9h')))
+    assert historico.fecha_max == pd.Timestamp('2025-07-16')
+    assert historico.fecha_inicial == pd.Timestamp('2025-05-01')
+    assert historico.meses_en(historico.fecha_inicial, historico.fecha_max) == ('2025-05', '2025-06', '2025-07')
+    corto = modelo.HistoricoMensual.en_memoria(modelo.limpiar_datos(crudo(20, '2025-03-15')))
+    assert corto.fecha_inicial == corto.fecha_min == pd.Timestamp('2025-03-15')
+
+
+# --- Cubo de conteos vs groupby de pandas sobre las filas ---
+FRECUENCIA_PERIODO = {'dia': 'D', 'semana': 'W-SUN', 'mes': 'M'}
+
+
+def agrupar_filas(filas, columnas, total_tareas=False, granularidad='dia', fecha_desde=None):
+    # Referencia: groupby de pandas sobre las filas (sin grupos nulos), una columna Total_* por tipo
+    totales = pd.DataFrame({nombre: (filas[modelo.COL_FLAGS_TIPO].to_numpy() & bit) != 0 for nombre, bit in modelo.TOTALES_TIPO.items()}).astype(np.int64)
+    if total_tareas: totales['Total_Tareas'] = 1
+    claves = []
+    for col in columnas:
+        if col == modelo.COL_DIA:
+            inicio = filas[modelo.COL_TEMP_DATETIME].dt.to_period(FRECUENCIA_PERIODO[granularidad]).dt.start_time
+            if fecha_desde is not None: inicio = inicio.clip(lower=fecha_desde)
+            claves.append(inicio.dt.date.rename(modelo.COL_FECHA_DIA).reset_index(drop=True))
+        else: claves.append(filas[col].astype(object).reset_index(drop=True))
+    return totales.groupby(claves, dropna=True).sum().reset_index()
+
+
+def como_tabla(df):
+    df = df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    return df.sort_values(list(df.columns[:-len(modelo.TOTALES_TIPO)])).reset_index(drop=True)
+
+
+def test_cubo_agrega_igual_que_groupby():
+    filas = modelo.ordenar_por_fecha(modelo.limpiar_datos(crudo(900, '2025-01-01', 5, '5h')))
+    # Nulos de origen (categoría 'None'), nulos en la propia categórica (código -1, el groupby los descarta)
+    # y órdenes con varios bits de tipo
+    assert 'None' in filas[modelo.COL_FILTRO_TECNICO].cat.categories
+    filas.loc[::17, modelo.COL_FILTRO_CIUDAD] = np.nan
+    filas.loc[::13, modelo.COL_FILTRO_TECNICO] = np.nan
+    assert (np.unpackbits(filas[modelo.COL_FLAGS_TIPO].to_numpy()[:, None] & 0x3F, axis=1).sum(axis=1) > 1).any()
+    cubo = modelo.CuboConteos(filas)
+    assert cubo.celdas[modelo.COL_CONTEO].sum() == len(filas)
+
+    desde, hasta = pd.Timestamp('2025-01-05'), pd.Timestamp('2025-06-20')  # domingo: la primera semana y el primer mes empiezan antes
+    en_rango = filas[(filas[modelo.COL_TEMP_DATETIME] >= desde) & (filas[modelo.COL_TEMP_DATETIME] < hasta + pd.Timedelta(days=1))]
+    satisfactorias = en_rango[(en_rango[modelo.COL_FLAGS_TIPO] & modelo.BIT_SATISFACTORIA) != 0]
+    celdas = cubo.filtrar(desde, hasta, {})
+    vistas = [([modelo.COL_FILTRO_CIUDAD], False, 'dia'), ([modelo.COL_FILTRO_TECNICO], False, 'dia'),
+              ([modelo.COL_FILTRO_CIUDAD, modelo.COL_FILTRO_TECNICO], True, 'dia'),
+              *(([modelo.COL_DIA], False, g) for g in modelo.GRANULARIDADES)]
+    for columnas, total_tareas, granularidad in vistas:
+        obtenido = modelo.agregar_cubo(celdas, columnas, total_tareas, granularidad)
+        esperado = agrupar_filas(satisfactorias, columnas, total_tareas, granularidad)
+        pd.testing.assert_frame_equal(como_tabla(obtenido), como_tabla(esperado), check_dtype=False)
+        # Con fecha_desde la primera cubeta se etiqueta con Desde, no con el inicio de su semana/mes
+        obtenido = modelo.agregar_cubo(celdas, columnas, total_tareas, granularidad, desde)
+        esperado = agrupar_filas(satisfactorias, columnas, total_tareas, granularidad, desde)
+        pd.testing.assert_frame_equal(como_tabla(obtenido), como_tabla(esperado), check_dtype=False)
+        if modelo.COL_DIA in columnas: assert obtenido[modelo.COL_FECHA_DIA].min() == desde.date()
+
+    # Con selección de técnicos y base por estado (en lugar del bit SATISFACTORIA)
+    tecnicos = list(filas[modelo.COL_FILTRO_TECNICO].cat.categories[:2])
+    celdas = cubo.filtrar(desde, hasta, {modelo.COL_FILTRO_TECNICO: tecnicos}, estado_base='PENDIENTE')
+    pendientes = en_rango[en_rango[modelo.COL_FILTRO_TECNICO].isin(tecnicos) & (en_rango[modelo.COL_FILTRO_ESTADO] == 'PENDIENTE')]
+    obtenido = modelo.agregar_cubo(celdas, [modelo.COL_FILTRO_TECNICO])
+    pd.testing.assert_frame_equal(como_tabla(obtenido), como_tabla(agrupar_filas(pendientes, [modelo.COL_FILTRO_TECNICO])), check_dtype=False)
+    totales = modelo.totales_cubo(celdas)
+    assert totales['Total_Tareas'] == len(pendientes)
+    assert len(pendientes) and totales == {n: int(((pendientes[modelo.COL_FLAGS_TIPO] & b) != 0).sum()) for n, b in modelo.TOTALES_TIPO.items()} | {'Total_Tareas': len(pendientes)}
+
+
+def test_sumar_por_grupo_y_matriz_tipos():
+    celdas = pd.DataFrame({modelo.COL_FLAGS_TIPO: np.array([modelo.BIT_INSTALACION | modelo.BIT_MIGRATEC, 0, modelo.BIT_VISITA], dtype=np.uint8),
+                           modelo.COL_CONTEO: [3, 5, 2]})
+    matriz = modelo.matriz_tipos(celdas, total_tareas=True)
+    assert matriz.tolist() == [[3, 0, 0, 0, 0, 3, 3], [0, 0, 0, 0, 0, 0, 5], [0, 2, 0, 0, 0, 0, 2]]
+    sumas = modelo.sumar_por_grupo(np.array([1, 0, 1]), matriz, 3)
+    assert sumas.tolist() == [[0, 0, 0, 0, 0, 0, 5], [3, 2, 0, 0, 0, 3, 5], [0] * 7]
+
+
+
+def test_top_n_por_total_de_tareas_distintas():
+    # 'a' suma más en los Total_* (tareas con dos tipos) y 'b' tiene más tareas (sin tipo): manda Total_Tareas
+    df = pd.DataFrame({'T': ['a', 'b', 'c', 'd'], 'Total_Instalaciones': [5, 0, 3, 1], 'Total_MigraTec': [5, 0, 3, 1], 'Total_Tareas': [5, 9, 4, 1]})
+    top = modelo.top_n_con_otros(df, 'T', ['Total_Instalaciones', 'Total_MigraTec', 'Total_Tareas'], 2, 'Total_Tareas')
+    assert top.values.tolist() == [['a', 5, 5, 5], ['b', 0, 0, 9], [modelo.ETIQUETA_OTROS, 4, 4, 5]]
+
+
+# --- Índice de bitmaps vs filtro cruzado sobre filas ---
+def apply_filter(df, col_key_filtro, selected_options):
+    # Filtro de la versión original del dashboard (por filas, comparando como texto)
+    if not selected_options: return df
+    if col_key_filtro not in df.columns: return df
+    return df[df[col_key_filtro].astype(str).isin(selected_options)]
+
+
+def get_multiselect_options(df, col_key_filtro):
+    if col_key_filtro not in df.columns: return []
+    return sorted([v for v in df[col_key_filtro].astype(str).unique() if pd.notna(v) and str(v).strip() not in ('nan', 'none', '')])
+
+
+def opciones_por_filas(df, selecciones):
+    opciones = {}
+    for col in selecciones:
+        filtrado = df
+        for otra, valores in selecciones.items():
+            if otra != col: filtrado = apply_filter(filtrado, otra, valores)
+        opciones[col] = get_multiselect_options(filtrado, col)
+    return opciones
+
+
+def test_opciones_cruzadas_igual_que_filtrar_filas():
+    filas = modelo.ordenar_por_fecha(modelo.limpiar_datos(crudo(203, '2025-01-01', 7)))
+    indice = modelo.IndiceBitmaps(filas)
+    assert indice.palabras == 4  # 203 filas: la última palabra va incompleta
+    tecnicos = list(filas[modelo.COL_FILTRO_TECNICO].cat.categories)
+    ciudades = list(filas[modelo.COL_FILTRO_CIUDAD].cat.categories)
+    estados = list(filas[modelo.COL_FILTRO_ESTADO].cat.categories)
+    casos = [
+        {},
+        {modelo.COL_FILTRO_TECNICO: tecnicos[:1]},                                          # un valor
+        {modelo.COL_FILTRO_TECNICO: tecnicos[:2]},                                          # OR dentro del filtro
+        {modelo.COL_FILTRO_TECNICO: tecnicos[1:3], modelo.COL_FILTRO_CIUDAD: ciudades[:1]},  # AND entre filtros
+        {modelo.COL_FILTRO_CIUDAD: ciudades[1:], modelo.COL_FILTRO_ESTADO: estados[:1], modelo.COL_FILTRO_TIPO_ORDEN: ['INSTALACION MIGRATEC']},
+        {modelo.COL_FILTRO_TECNICO: ['NO EXISTE']},                                         # valor inexistente: sin filas
+    ]
+    tramos = [(0, len(filas)), (5, 70), (63, 129), (130, 203), (90, 90)]
+    for tramo in tramos:
+        for caso in casos:
+            selecciones = {col: caso.get(col, []) for col in [modelo.COL_FILTRO_CIUDAD, modelo.COL_FILTRO_TECNICO, modelo.COL_FILTRO_ESTADO,
+                                                              modelo.COL_FILTRO_TIPO_ORDEN, modelo.COL_FILTRO_TECNOLOGIA, modelo.COL_FILTRO_TIPO_MANUAL]}
+            esperado = opciones_por_filas(filas.iloc[tramo[0]:tramo[1]], selecciones)
+            assert indice.opciones_cruzadas(tramo, selecciones) == esperado, (tramo, caso)
+
+
+# --- Orden precalculado de la tabla ---
+def test_orden_de_paginas_igual_que_sort_values():
+    filas = modelo.ordenar_por_fecha(modelo.limpiar_datos(crudo(260, '2025-01-01', 11)))
+    filas.loc[::9, modelo.COL_FILTRO_CIUDAD] = np.nan  # nulos en una categórica
+    filas['I'] = pd.Categorical(filas['I'], categories=filas['I'].dropna().unique())  # como un CSV: categorías sin ordenar
+    base = modelo.BaseIndexada(filas)
+    seleccion = np.flatnonzero(np.random.default_rng(3).random(len(filas)) < 0.6)
+    columnas = ['F', 'D', 'I', modelo.COL_FILTRO_CIUDAD, modelo.COL_FILTRO_TECNICO, modelo.COL_TEMP_DATETIME]
+    assert base.datos['F'].isna().any() and base.datos['I'].isna().any() and base.datos[modelo.COL_FILTRO_CIUDAD].isna().any()
+    for columna in columnas:
+        for ascendente in (True, False):
+            ordenadas = base.ordenar_seleccion(seleccion, columna, ascendente)
+            # Orden del texto, no de las categorías
+            esperado = base.datos.iloc[seleccion].sort_values(columna, ascending=ascendente, na_position='last', kind='stable',
+                                                             key=lambda s: s.astype(object)).index.to_numpy()
+            for pagina in range(0, len(seleccion), 50):
+                assert ordenadas[pagina:pagina + 50].tolist() == esperado[pagina:pagina + 50].tolist(), (columna, ascendente, pagina)
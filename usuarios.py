@@ -0,0 +1,62 @@
+import os
+import hmac
+import hashlib
+import threading
+import pandas as pd
+import ingesta
+
+# --- DIRECTORIO DE USUARIOS ---
+# La tabla de usuarios se lee una sola vez por cambio del archivo (tamaño/mtime; si cambian, hash del
+# contenido) y queda en un dict por usuario normalizado: el login es una búsqueda O(1) y los reruns no
+# vuelven a abrir la hoja de cálculo. La hoja guarda las contraseñas en claro, así que el hash (PBKDF2 con
+# sal) no protege el archivo: solo evita conservar las contraseñas en memoria. Todas las filas se hashean
+# al leer la hoja (una vez por cambio del archivo) y un usuario desconocido paga el mismo hash contra una
+# sal ficticia, para que el tiempo de respuesta no delate qué usuarios existen.
+ITERACIONES_HASH = int(os.getenv("USUARIOS_ITERACIONES_HASH", 100000))
+_DIRECTORIOS = {}  # ruta -> {'huella': (tamaño, mtime) o None, 'hash': hash del contenido, 'usuarios': dict}
+_LOCK = threading.Lock()
+_SAL_FICTICIA = os.urandom(16)
+
+
+def normalizar_usuario(usuario):
+    return str(usuario).strip().lower()
+
+
+def hash_contrasena(contrasena, sal):
+    return hashlib.pbkdf2_hmac('sha256', contrasena.encode('utf-8'), sal, ITERACIONES_HASH)
+
+
+def construir_directorio(df):
+    # {usuario normalizado: {'sal', 'filas': [(hash, rol)]}}. Un usuario repetido conserva todas sus filas
+    # (en orden): vale cualquiera cuya contraseña coincida, como al filtrar la tabla completa.
+    usuarios = {}
+    for usuario, contrasena, rol in df[['Usuario', 'Contraseña', 'Rol']].astype(str).itertuples(index=False, name=None):
+        entrada = usuarios.setdefault(normalizar_usuario(usuario), {'sal': os.urandom(16), 'filas': []})
+        entrada['filas'].append((hash_contrasena(contrasena.strip(), entrada['sal']), rol.strip()))
+    return usuarios
+
+
+def obtener_directorio(ruta, por_defecto):
+    # por_defecto() -> DataFrame con los usuarios a usar si el archivo no existe
+    try:
+        stat = os.stat(ruta)
+        huella = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError: huella = None
+    with _LOCK: entrada = _DIRECTORIOS.get(ruta)
+    if entrada is not None and entrada['huella'] == huella: return entrada['usuarios']
+    contenido = ingesta.hash_contenido(ruta) if huella is not None else None
+    if entrada is not None and contenido is not None and entrada['hash'] == contenido: usuarios = entrada['usuarios']
+    else: usuarios = construir_directorio(pd.read_excel(ruta) if huella is not None else por_defecto())
+    with _LOCK: _DIRECTORIOS[ruta] = {'huella': huella, 'hash': contenido, 'usuarios': usuarios}
+    return usuarios
+
+
+def autenticar(ruta, usuario, contrasena, por_defecto):
+    # Devuelve el rol de la primera fila del usuario con esa contraseña, o None si ninguna coincide
+    entrada = obtener_directorio(ruta, por_defecto).get(normalizar_usuario(usuario))
+    if entrada is None:
+        hash_contrasena(contrasena.strip(), _SAL_FICTICIA)  # mismo coste que un usuario existente
+        return None
+    valor = hash_contrasena(contrasena.strip(), entrada['sal'])
+    roles = [rol for guardado, rol in entrada['filas'] if hmac.compare_digest(valor, guardado)]
+    return roles[0] if roles else None